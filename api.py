@@ -0,0 +1,266 @@
+"""
+JSON HTTP API for similar-issue lookups, for bots and CI (no Streamlit session needed).
+
+Endpoints:
+    GET  /similar/{issue_id}   single lookup, optional query parameters:
+                               tags, tags_2 (comma separated overrides), subject_boost,
+                               search_field_boost, search_field_2_boost, size
+    POST /similar/batch        {"ids": [...]} or {"lookups": [{"id": ..., "tags": [...], ...}, ...]}
+                               plus optional defaults for the same parameters on top level.
+                               Records are fetched with one _mget, the searches go out as _msearch
+                               and results are streamed back as NDJSON, one line per lookup.
+
+Invalid parameters are rejected with 400 before any result is sent, size is limited to
+api_max_result_count.
+
+Usage:
+    python api.py [--port 8080]
+"""
+import argparse
+import json
+import math
+import os
+
+from aiohttp import web
+from dotenv import load_dotenv
+from elasticsearch import AsyncElasticsearch, NotFoundError
+
+from elasticsearch_module import build_similar_records_query, split_values
+
+load_dotenv()
+
+SEARCH_FIELD = os.getenv("search_field", "relations")
+SEARCH_FIELD_2 = os.getenv("search_field_2", "relations_sequence")
+RESULT_COUNT = int(os.getenv("result_count", "10"))
+DEFAULT_SUBJECT_BOOST = float(os.getenv("subject_boost", "1"))
+DEFAULT_SEARCH_FIELD_BOOST = float(os.getenv("search_field_boost", "0.2"))
+DEFAULT_SEARCH_FIELD_2_BOOST = float(os.getenv("search_field_2_boost", "0.000001"))
+MAX_BATCH_SIZE = int(os.getenv("api_max_batch_size", "1000"))
+MAX_RESULT_COUNT = int(os.getenv("api_max_result_count", "100"))
+# Lookups per _msearch request, so the first lines of a large batch are streamed early
+MSEARCH_CHUNK_SIZE = int(os.getenv("api_msearch_chunk_size", "200"))
+
+RESULT_SOURCE_FIELDS = ["subject", "status"]
+BATCH_FORMAT_ERROR = "expected {\"ids\": [...]} or {\"lookups\": [{\"id\": ...}, ...]}"
+BOOST_PARAMETERS = {
+    "subject_boost": DEFAULT_SUBJECT_BOOST,
+    "search_field_boost": DEFAULT_SEARCH_FIELD_BOOST,
+    "search_field_2_boost": DEFAULT_SEARCH_FIELD_2_BOOST,
+}
+
+
+class SimilarIssuesApi:
+    def __init__(self, host=os.environ.get('elasticsearch_host', 'localhost'),
+                 port=os.environ.get('elasticsearch_port', '9200'),
+                 username=os.environ.get('elasticsearch_username', ''),
+                 password=os.environ.get('elasticsearch_password', ''),
+                 index_name=os.environ.get('index_name')):
+        self.es = AsyncElasticsearch(f"http://{host}:{port}", basic_auth=(username, password))
+        self.index_name = index_name
+
+    @staticmethod
+    def parse_options(options):
+        """
+        Validate the overrides of one lookup and fill in the defaults.
+
+        Values may be strings (query parameters) or JSON values (batch payload).
+
+        Returns:
+            dict: tags, tags_2 (None to use the record's tags), the boosts as float and size as int.
+
+        Raises:
+            ValueError: If a value has the wrong type or is out of range.
+        """
+        parsed = {}
+        for name in ("tags", "tags_2"):
+            value = options.get(name)
+            if isinstance(value, list):
+                if not all(isinstance(tag, (str, int)) and not isinstance(tag, bool) for tag in value):
+                    raise ValueError(f"{name} must be a list of strings")
+            elif value is not None and not isinstance(value, str):
+                raise ValueError(f"{name} must be a string or a list of strings")
+            parsed[name] = value
+
+        for name, default in BOOST_PARAMETERS.items():
+            value = options.get(name, default)
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f"{name} must be a number")
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError(f"{name} must be a number")
+            if not math.isfinite(value):
+                raise ValueError(f"{name} must be a finite number")
+            parsed[name] = value
+
+        size = options.get("size", RESULT_COUNT)
+        if isinstance(size, bool) or not isinstance(size, (int, str)):
+            raise ValueError("size must be an integer")
+        try:
+            size = int(size)
+        except ValueError:
+            raise ValueError("size must be an integer")
+        if not 1 <= size <= MAX_RESULT_COUNT:
+            raise ValueError(f"size must be between 1 and {MAX_RESULT_COUNT}")
+        parsed["size"] = size
+        return parsed
+
+    def build_query(self, issue_id, record, options):
+        """Query for one lookup from the parsed options, tags fall back to those of the record."""
+        tags = options["tags"]
+        tags_2 = options["tags_2"]
+        return build_similar_records_query(
+            record,
+            SEARCH_FIELD,
+            split_values(tags) if tags is not None else split_values(record.get(SEARCH_FIELD)),
+            SEARCH_FIELD_2,
+            split_values(tags_2) if tags_2 is not None else split_values(record.get(SEARCH_FIELD_2)),
+            options["subject_boost"],
+            options["search_field_boost"],
+            options["search_field_2_boost"],
+            issue_id,
+            options["size"],
+            source_fields=RESULT_SOURCE_FIELDS
+        )
+
+    @staticmethod
+    def compact_result(issue_id, response):
+        if "error" in response:
+            return {"id": issue_id, "error": response["error"].get("reason", "search failed")}
+        return {
+            "id": issue_id,
+            "results": [
+                {
+                    "id": hit["_id"],
+                    "score": hit["_score"],
+                    "subject": hit["_source"].get("subject", ""),
+                    "status": hit["_source"].get("status", ""),
+                } for hit in response["hits"]["hits"]
+            ]
+        }
+
+    async def similar(self, request):
+        issue_id = request.match_info["issue_id"]
+        try:
+            options = self.parse_options(dict(request.query))
+        except ValueError as e:
+            return web.json_response({"id": issue_id, "error": str(e)}, status=400)
+
+        try:
+            record = (await self.es.get(index=self.index_name, id=issue_id))["_source"]
+        except NotFoundError:
+            return web.json_response({"id": issue_id, "error": "not found"}, status=404)
+
+        query = self.build_query(issue_id, record, options)
+        response = await self.es.search(index=self.index_name, body=query)
+        return web.json_response(self.compact_result(issue_id, response))
+
+    @classmethod
+    def parse_batch(cls, payload):
+        """
+        Normalize and validate the batch payload, before anything is streamed back.
+
+        Returns:
+            list: (issue_id, parsed options) per lookup.
+
+        Raises:
+            ValueError: If the payload is malformed or a lookup has invalid options.
+        """
+        if not isinstance(payload, dict):
+            raise ValueError(BATCH_FORMAT_ERROR)
+        defaults = {key: value for key, value in payload.items() if key not in ("ids", "lookups")}
+        lookups = payload.get("lookups")
+        if lookups is None:
+            ids = payload.get("ids")
+            if not isinstance(ids, list):
+                raise ValueError(BATCH_FORMAT_ERROR)
+            lookups = [{"id": issue_id} for issue_id in ids]
+        elif not isinstance(lookups, list) or not all(isinstance(lookup, dict) for lookup in lookups):
+            raise ValueError(BATCH_FORMAT_ERROR)
+
+        parsed = []
+        for position, lookup in enumerate(lookups):
+            issue_id = lookup.get("id")
+            if isinstance(issue_id, bool) or not isinstance(issue_id, (str, int)):
+                raise ValueError(f"lookup {position}: id must be a string or an integer")
+            try:
+                options = cls.parse_options(dict(defaults, **lookup))
+            except ValueError as e:
+                raise ValueError(f"lookup {position}: {e}")
+            parsed.append((str(issue_id), options))
+        return parsed
+
+    async def batch(self, request):
+        try:
+            payload = await request.json()
+        except ValueError:
+            return web.json_response({"error": BATCH_FORMAT_ERROR}, status=400)
+        try:
+            lookups = self.parse_batch(payload)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        if len(lookups) > MAX_BATCH_SIZE:
+            return web.json_response({"error": f"at most {MAX_BATCH_SIZE} lookups per batch"}, status=400)
+
+        stream = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await stream.prepare(request)
+
+        for start in range(0, len(lookups), MSEARCH_CHUNK_SIZE):
+            lines = await self.batch_chunk(lookups[start:start + MSEARCH_CHUNK_SIZE])
+            await stream.write("".join(json.dumps(line) + "\n" for line in lines).encode("utf-8"))
+
+        await stream.write_eof()
+        return stream
+
+    async def batch_chunk(self, lookups):
+        """One _mget for the reference records, one _msearch for all lookups of the chunk."""
+        unique_ids = list(dict.fromkeys(issue_id for issue_id, _ in lookups))
+        docs = await self.es.mget(index=self.index_name, ids=unique_ids,
+                                  source_includes=["subject", SEARCH_FIELD, SEARCH_FIELD_2])
+        records = {doc["_id"]: doc["_source"] for doc in docs["docs"] if doc.get("found")}
+
+        lines = [None] * len(lookups)
+        searches = []
+        searched_positions = []
+        for position, (issue_id, options) in enumerate(lookups):
+            if issue_id not in records:
+                lines[position] = {"id": issue_id, "error": "not found"}
+                continue
+            try:
+                query = self.build_query(issue_id, records[issue_id], options)
+            except (ValueError, TypeError) as e:
+                lines[position] = {"id": issue_id, "error": str(e)}
+                continue
+            searches.extend([{}, query])
+            searched_positions.append(position)
+
+        if searches:
+            responses = await self.es.msearch(index=self.index_name, searches=searches)
+            for position, response in zip(searched_positions, responses["responses"]):
+                lines[position] = self.compact_result(lookups[position][0], response)
+        return lines
+
+    async def close(self, app):
+        await self.es.close()
+
+    def application(self):
+        app = web.Application()
+        app.add_routes([
+            web.post("/similar/batch", self.batch),
+            web.get("/similar/{issue_id}", self.similar),
+        ])
+        app.on_cleanup.append(self.close)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON HTTP API for similar issue lookups.")
+    parser.add_argument("--host", default=os.getenv("api_host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("api_port", "8080")))
+    args = parser.parse_args()
+
+    web.run_app(SimilarIssuesApi().application(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
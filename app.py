@@ -1,14 +1,44 @@
 import streamlit as st
 from elasticsearch_module import Elasticsearch
 from result_renderer import ElasticsearchResultRenderer
+from relation_graph import RelationGraph
+from warmup import warm_up
 from dotenv import load_dotenv, dotenv_values
 import os
+import threading
 load_dotenv()
 
+@st.cache_resource
+def load_relation_graph(path):
+    # Built by relation_graph.py, shared by all sessions
+    if path and os.path.exists(path):
+        return RelationGraph.load(path)
+    return None
+
+def prepare_es_client(es_client):
+    try:
+        es_client.connect()
+        if os.environ.get('warmup_on_start', 'False').lower() in ["true", "1", "yes", "y"]:
+            warm_up(es_client)
+    except Exception as e:
+        # The first search connects again and shows the error on the page
+        print(f"Preparing Elasticsearch client failed: {e}")
+
+@st.cache_resource
+def get_es_client():
+    # One client per process, connected (and optionally warmed up) in the background while the first page renders
+    es_client = Elasticsearch()
+    threading.Thread(target=prepare_es_client, args=(es_client,), daemon=True).start()
+    return es_client
+
 class StreamlitApp:
     def __init__(self):
-        self.es_client =  Elasticsearch()
+        self.es_client = get_es_client()
         self.tags_field_name = os.environ.get('search_field')
+        self.vector_field_name = os.environ.get('vector_field')
+        self.render_chunk_size = int(os.environ.get('render_chunk_size', '20'))
+        self.relation_graph = load_relation_graph(os.environ.get('relation_graph_path', 'relation_graph.pickle'))
+        self.relation_hops = int(os.environ.get('relation_hops', '1'))
 
     def search_provided(self):
         st.session_state["search_clicked"] = True
@@ -72,7 +102,11 @@ class StreamlitApp:
     def filter_checked_items(self):
         return [item['label'] for item in st.session_state["item_states"].values() if item['checked']]
     
-    def get_related_ids(self, record):
+    def get_related_ids(self, record, record_id=None):
+        # Use the precomputed relation graph (incl. transitive links) when the issue is in it
+        if self.relation_graph and record_id and record_id in self.relation_graph:
+            return list(self.relation_graph.k_hop(record_id, self.relation_hops))
+
         # Extract the comma-separated strings from the record
         relations = record.get('relations', None)
         relations_dupe = record.get('relations_dupe', None)
@@ -82,25 +116,27 @@ class StreamlitApp:
         all_ids = filter(None, [relations, relations_dupe, relations_sequence])
 
         # Split the strings into individual IDs and flatten the resulting list
+        # (indices with managed mapping already store them as arrays)
         ids = []
         for id_str in all_ids:
-            ids.extend(id_str.split(","))
+            ids.extend(id_str if isinstance(id_str, list) else id_str.split(","))
 
         # Return a list of unique values
         return list(set(ids))
     
-    def get_common_ids(self, record, search_results):
+    def get_common_ids(self, record, search_results, record_id=None):
         """
         Get common IDs between unique IDs from the record and IDs from Elasticsearch search results.
 
         Args:
             record (dict): A dictionary containing the keys 'relations', 'relations_dupe', and 'relations_sequence'.
             search_results (dict): The results returned by the Elasticsearch search function.
+            record_id (str): ID of the record, used to look it up in the relation graph (default: None).
 
         Returns:
             list: A list of IDs common to both sources.
         """
-        unique_ids = self.get_related_ids(record)
+        unique_ids = self.get_related_ids(record, record_id)
         search_ids = self.es_client.get_ids_from_search_results(search_results)
 
         common_ids = list(set(unique_ids).intersection(search_ids))
@@ -138,23 +174,51 @@ class StreamlitApp:
             #if st.session_state["item_states"]:
             tags = self.filter_checked_items()
         
-            similar_results = self.es_client.search_by_terms(
-                self.tags_field_name,
-                tags,
-                st.session_state['record']['_source'],
-                [st.session_state["record_id"]]
-            )
+            if self.vector_field_name:
+                # Tags and embedding searched concurrently, vector leg is dropped if it is too slow
+                similar_results = self.es_client.hybrid_search(
+                    self.tags_field_name,
+                    tags,
+                    st.session_state['record']['_source'],
+                    self.vector_field_name,
+                    [st.session_state["record_id"]]
+                )
+                # Records without embedding never start the vector leg, only a dropped leg is worth a note
+                if 'vector' in similar_results['attempted_legs'] and 'vector' not in similar_results['legs']:
+                    st.caption("Vector search unavailable, showing tag based results only.")
+            else:
+                similar_results = self.es_client.search_by_terms(
+                    self.tags_field_name,
+                    tags,
+                    st.session_state['record']['_source'],
+                    [st.session_state["record_id"]]
+                )
 
             st.text(f"Tags of searched issue: {tags}")
-            related_ids = self.get_related_ids(st.session_state['record']['_source'])
+            related_ids = self.get_related_ids(st.session_state['record']['_source'], st.session_state["record_id"])
             common_ids = []
             if related_ids:
                 st.text(f"Related issues ids {related_ids}")
-                common_ids = self.get_common_ids(st.session_state['record']['_source'], similar_results)
+                common_ids = self.get_common_ids(st.session_state['record']['_source'], similar_results, st.session_state["record_id"])
                 st.progress(len(common_ids)/len(related_ids), text=f"{len(common_ids)}/{len(related_ids)} related issues found in results.\n{common_ids}")
-            similar_output = ElasticsearchResultRenderer.render_similar_results(similar_results, self.tags_field_name, common_ids)
+            likely_duplicates = st.session_state['record']['_source'].get('likely_duplicates')
+            if likely_duplicates:
+                st.text(f"Likely duplicates (precomputed) {likely_duplicates}")
             st.markdown("#### Results")
-            st.markdown(similar_output)
+            # Hits are formatted lazily and pushed to the page in chunks
+            if st.checkbox("Compact table view", key="compact_view"):
+                ElasticsearchResultRenderer.stream_chunks(
+                    ElasticsearchResultRenderer.iter_similar_table_rows(similar_results, self.tags_field_name, common_ids),
+                    st.markdown,
+                    self.render_chunk_size,
+                    header=ElasticsearchResultRenderer.similar_table_header(self.tags_field_name)
+                )
+            else:
+                ElasticsearchResultRenderer.stream_chunks(
+                    ElasticsearchResultRenderer.iter_similar_results(similar_results, self.tags_field_name, common_ids),
+                    st.markdown,
+                    self.render_chunk_size
+                )
             
 
 if __name__ == "__main__":
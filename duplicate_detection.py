@@ -0,0 +1,284 @@
+"""
+Corpus-wide duplicate cluster detection with MinHash / LSH.
+
+Builds MinHash signatures over subject and tag shingles for every issue, buckets them with
+LSH banding, verifies candidate pairs by Jaccard similarity and groups them into clusters.
+Precision and recall are measured against the existing relations_dupe links.
+
+The verified pairs are stored per issue in the `likely_duplicates` field (list of IDs),
+which the apps display next to the searched issue.
+
+Usage:
+    python duplicate_detection.py --threshold 0.5 --output duplicates.json --update-index
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+from collections import defaultdict
+
+from elasticsearch.helpers import bulk, scan
+
+from elasticsearch_module import Elasticsearch, split_values
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+LIKELY_DUPLICATES_FIELD = 'likely_duplicates'
+
+
+class MinHashLSH:
+    def __init__(self, num_perm=128, bands=32, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self.permutations = [(rng.randint(1, MERSENNE_PRIME - 1), rng.randint(0, MERSENNE_PRIME - 1))
+                             for _ in range(num_perm)]
+
+    @staticmethod
+    def hash_shingle(shingle):
+        # Python's hash() is salted per process, so use a stable hash
+        return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def signature(self, shingles):
+        hashes = [self.hash_shingle(shingle) for shingle in shingles]
+        if not hashes:
+            return None
+        return tuple(
+            min(((a * value + b) % MERSENNE_PRIME) & MAX_HASH for value in hashes)
+            for a, b in self.permutations
+        )
+
+    def candidate_pairs(self, signatures, max_bucket_size=200):
+        """
+        Return candidate pairs of documents sharing at least one LSH band.
+
+        Buckets larger than max_bucket_size are skipped (usually boilerplate subjects),
+        which keeps the pair generation near-linear in the corpus size.
+        """
+        pairs = set()
+        for band in range(self.bands):
+            start = band * self.rows
+            buckets = defaultdict(list)
+            for doc_id, signature in signatures.items():
+                buckets[signature[start:start + self.rows]].append(doc_id)
+            for members in buckets.values():
+                if len(members) < 2 or len(members) > max_bucket_size:
+                    continue
+                members.sort()
+                for i, left in enumerate(members):
+                    for right in members[i + 1:]:
+                        pairs.add((left, right))
+        return pairs
+
+
+class DuplicateDetector:
+    def __init__(self, es_client=None, tags_field=os.environ.get('search_field'), shingle_size=2,
+                 threshold=0.5, num_perm=128, bands=32):
+        self.es_client = es_client or Elasticsearch()
+        self.tags_field = tags_field
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.lsh = MinHashLSH(num_perm=num_perm, bands=bands)
+
+    def shingles(self, source):
+        """Word n-grams of the subject plus one shingle per tag."""
+        words = re.findall(r"\w+", str(source.get('subject') or '').lower())
+        shingles = {
+            'subject:' + ' '.join(words[i:i + self.shingle_size])
+            for i in range(max(1, len(words) - self.shingle_size + 1))
+        } if words else set()
+
+        tags = source.get(self.tags_field) if self.tags_field else None
+        if isinstance(tags, str):
+            # Only commas separate tags here, a tag may consist of several words
+            tags = tags.split(',')
+        elif not isinstance(tags, list):
+            tags = [tags] if tags is not None else []
+        tags = (str(tag).strip().lower() for tag in tags if tag is not None)
+        shingles.update('tag:' + tag for tag in tags if tag)
+        return shingles
+
+    def load_corpus(self):
+        """
+        Scroll through the whole index.
+
+        Returns:
+            tuple: Shingles, relations_dupe links and the stored likely duplicates, each per issue.
+        """
+        fields = ['subject', 'relations_dupe', LIKELY_DUPLICATES_FIELD] + ([self.tags_field] if self.tags_field else [])
+        shingles = {}
+        dupes = {}
+        stored = {}
+        for hit in scan(self.es_client.es, index=self.es_client.index_name, _source=fields, size=1000):
+            shingles[hit['_id']] = self.shingles(hit['_source'])
+            dupes[hit['_id']] = split_values(hit['_source'].get('relations_dupe'))
+            stored[hit['_id']] = split_values(hit['_source'].get(LIKELY_DUPLICATES_FIELD))
+        return shingles, dupes, stored
+
+    @staticmethod
+    def jaccard(left, right):
+        if not left or not right:
+            return 0.0
+        return len(left & right) / len(left | right)
+
+    def find_duplicate_pairs(self, shingles):
+        signatures = {}
+        for doc_id, doc_shingles in shingles.items():
+            signature = self.lsh.signature(doc_shingles)
+            if signature:
+                signatures[doc_id] = signature
+
+        candidates = self.lsh.candidate_pairs(signatures)
+        # Verify candidates on the exact shingle sets to drop LSH false positives
+        return {
+            pair: similarity for pair, similarity in (
+                (pair, self.jaccard(shingles[pair[0]], shingles[pair[1]])) for pair in candidates
+            ) if similarity >= self.threshold
+        }, len(candidates)
+
+    @staticmethod
+    def build_clusters(pairs):
+        """Union-find over the verified pairs."""
+        parent = {}
+
+        def find(node):
+            parent.setdefault(node, node)
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        for left, right in pairs:
+            root_left, root_right = find(left), find(right)
+            if root_left != root_right:
+                parent[root_right] = root_left
+
+        clusters = defaultdict(list)
+        for node in parent:
+            clusters[find(node)].append(node)
+        return sorted((sorted(members) for members in clusters.values()), key=len, reverse=True)
+
+    @staticmethod
+    def evaluate(pairs, clusters, dupes):
+        """Precision and recall of the found pairs against the relations_dupe links."""
+        known_ids = set(dupes)
+        truth = {
+            tuple(sorted((doc_id, other)))
+            for doc_id, others in dupes.items() for other in others
+            if other in known_ids and other != doc_id
+        }
+        predicted = set(pairs)
+        true_positives = len(predicted & truth)
+
+        cluster_of = {doc_id: index for index, members in enumerate(clusters) for doc_id in members}
+        clustered = sum(
+            1 for left, right in truth
+            if left in cluster_of and cluster_of[left] == cluster_of.get(right)
+        )
+        return {
+            'known_pairs': len(truth),
+            'found_pairs': len(predicted),
+            'precision': true_positives / len(predicted) if predicted else 0.0,
+            'recall': true_positives / len(truth) if truth else 0.0,
+            'cluster_recall': clustered / len(truth) if truth else 0.0,
+        }
+
+    @staticmethod
+    def likely_duplicates(pairs):
+        """Per issue list of likely duplicates, most similar first."""
+        neighbours = defaultdict(list)
+        for (left, right), similarity in pairs.items():
+            neighbours[left].append((similarity, right))
+            neighbours[right].append((similarity, left))
+        return {
+            doc_id: [other for _, other in sorted(others, reverse=True)]
+            for doc_id, others in neighbours.items()
+        }
+
+    @staticmethod
+    def changed_lists(likely_duplicates, stored):
+        """Issues whose stored list differs from the new one, including stale lists to clear."""
+        return {
+            doc_id: likely_duplicates.get(doc_id, [])
+            for doc_id in stored.keys() | likely_duplicates.keys()
+            if likely_duplicates.get(doc_id, []) != stored.get(doc_id, [])
+        }
+
+    def update_index(self, likely_duplicates, stored):
+        """
+        Store the likely duplicates of the issues whose list changed.
+
+        Returns:
+            dict: Number of updated issues and the errors of failed updates.
+        """
+        changed = self.changed_lists(likely_duplicates, stored)
+        actions = (
+            {
+                '_op_type': 'update',
+                '_index': self.es_client.index_name,
+                '_id': doc_id,
+                'doc': {LIKELY_DUPLICATES_FIELD: duplicates}
+            } for doc_id, duplicates in changed.items()
+        )
+        updated, errors = bulk(self.es_client.es, actions, chunk_size=1000, raise_on_error=False)
+        return {'changed': len(changed), 'updated': updated, 'errors': errors}
+
+    def run(self, update=False):
+        shingles, dupes, stored = self.load_corpus()
+        pairs, candidate_count = self.find_duplicate_pairs(shingles)
+        clusters = self.build_clusters(pairs)
+        likely_duplicates = self.likely_duplicates(pairs)
+
+        report = {
+            'documents': len(shingles),
+            'candidate_pairs': candidate_count,
+            'metrics': self.evaluate(pairs, clusters, dupes),
+            'clusters': clusters,
+            'likely_duplicates': likely_duplicates,
+        }
+        if update:
+            report['index_update'] = self.update_index(likely_duplicates, stored)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate issue clusters with MinHash/LSH.")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Minimum Jaccard similarity of a pair")
+    parser.add_argument("--num-perm", type=int, default=128, help="Number of MinHash permutations")
+    parser.add_argument("--bands", type=int, default=32, help="Number of LSH bands (must divide num-perm)")
+    parser.add_argument("--shingle-size", type=int, default=2, help="Word n-gram size of subject shingles")
+    parser.add_argument("--output", help="Write clusters and likely duplicates as JSON to this file")
+    parser.add_argument("--update-index", action="store_true",
+                        help=f"Store likely duplicates in the '{LIKELY_DUPLICATES_FIELD}' field of each issue")
+    args = parser.parse_args()
+
+    detector = DuplicateDetector(shingle_size=args.shingle_size, threshold=args.threshold,
+                                 num_perm=args.num_perm, bands=args.bands)
+    report = detector.run(update=args.update_index)
+
+    print(f"Documents: {report['documents']}, candidate pairs: {report['candidate_pairs']}, "
+          f"clusters: {len(report['clusters'])}")
+    print(json.dumps(report['metrics'], indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle)
+
+    index_update = report.get('index_update')
+    if index_update:
+        print(f"Changed lists: {index_update['changed']}, updated: {index_update['updated']}, "
+              f"failed: {len(index_update['errors'])}")
+        for error in index_update['errors'][:10]:
+            print(json.dumps(error))
+        if index_update['errors']:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,226 @@
 import os
-from elasticsearch import Elasticsearch as ElasticClient
-from elasticsearch.exceptions import NotFoundError
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv, dotenv_values
 load_dotenv()
 
+RELATION_FIELDS = ['relations', 'relations_dupe', 'relations_sequence']
+RELATIONS_PIPELINE = 'forge-relations'
+
+def split_values(value):
+    """Split a comma/whitespace/semicolon separated string (or a list) into stripped values."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item for item in re.split(r"[,\s;]+", str(value).strip()) if item]
+
+
+def build_similar_records_query(reference_record, search_field, search_field_list, search_field_2,
+                                search_field_2_list, subject_boost, search_field_boost, search_field_2_boost,
+                                exclude_id, result_count, debug=False, source_fields=None):
+    """
+    Build the query for records similar to reference_record using 'should' clauses for:
+     - subject
+     - items from search_field_list (matched against search_field)
+     - items from search_field_2_list (matched against search_field_2)
+    Exclude the reference record by 'exclude_id'.
+
+    Args:
+        source_fields (list): Restrict the returned _source to these fields (default: whole _source).
+
+    Returns:
+        dict: Query body for search or as one entry of msearch.
+    """
+    subject_value = reference_record.get("subject", "")
+
+    should_clauses = []
+
+    # Add subject clause (if not empty)
+    if subject_value.strip():
+        should_clauses.append({
+            "match": {
+                "subject": {
+                    "query": subject_value,
+                    "boost": subject_boost
+                }
+            }
+        })
+
+    # Add search_field items
+    for item in search_field_list:
+        if item.strip():
+            should_clauses.append({
+                "match": {
+                    search_field: {
+                        "query": item.strip(),
+                        "boost": search_field_boost
+                    }
+                }
+            })
+
+    # Add search_field_2 items
+    for item in search_field_2_list:
+        if item.strip():
+            should_clauses.append({
+                "match": {
+                    search_field_2: {
+                        "query": item.strip(),
+                        "boost": search_field_2_boost
+                    }
+                }
+            })
+
+    query_body = {
+        "query": {
+            "bool": {
+                "must_not": [
+                    {"ids": {"values": [exclude_id]}}
+                ],
+                "should": should_clauses
+                # "minimum_should_match": 1  # if you only want docs that match at least one
+            }
+        },
+        "size": result_count
+    }
+
+    # If debug is True, we want to see explanation
+    if debug:
+        query_body["explain"] = True
+
+    if source_fields is not None:
+        query_body["_source"] = source_fields
+
+    return query_body
+
+
 class Elasticsearch:
     def __init__(self, index_name=os.environ.get('index_name'), host=os.environ.get('elasticsearch_host', 'localhost'),
                  port=os.environ.get('elasticsearch_port', '9200'),
                  username=os.environ.get('elasticsearch_username', ''),
                  password=os.environ.get('elasticsearch_password', '')):
-        self.es = ElasticClient(
-            f"http://{host}:{port}",
-            basic_auth=(username, password)
-        )
+        self.url = f"http://{host}:{port}"
+        self.basic_auth = (username, password)
         self.index_name = index_name
         self.size = os.environ.get('result_count')
 
-        # Create index if it doesn't exist
-        if not self.es.indices.exists(index=self.index_name):
-            self.es.indices.create(index=self.index_name)
+        # The client is created on first use (or by connect() in the background), so app start is not blocked
+        self._es = None
+        self._connected = False
+        self._connect_lock = threading.RLock()
+        self._vector_field_indexed = {}
+
+    @property
+    def es(self):
+        if not self._connected:
+            self.connect()
+        return self._es
+
+    def connect(self):
+        """
+        Import the client, connect and make sure the index exists. Safe to call from several threads,
+        e.g. in a background thread started together with the UI.
+        """
+        with self._connect_lock:
+            if self._es is not None:
+                # Connected already, or index creation below is in progress in this thread
+                return self._es
+            from elasticsearch import Elasticsearch as ElasticClient
+
+            self._es = ElasticClient(self.url, basic_auth=self.basic_auth)
+            try:
+                # Create index if it doesn't exist, index_name is an alias so it can be reindexed without downtime
+                if not self._es.indices.exists(index=self.index_name):
+                    self.create_index(self.versioned_index_name(), aliases=[self.index_name])
+            except Exception:
+                self._es = None
+                raise
+            self._connected = True
+            return self._es
+
+    def versioned_index_name(self):
+        return f"{self.index_name}_{time.strftime('%Y%m%d%H%M%S')}"
+
+    @staticmethod
+    def index_definition(search_field=os.environ.get('search_field'),
+                         search_field_2=os.environ.get('search_field_2'),
+                         vector_field=os.environ.get('vector_field'),
+                         vector_dims=os.environ.get('vector_dims'),
+                         refresh_interval=os.environ.get('refresh_interval', '30s'),
+                         number_of_replicas=os.environ.get('number_of_replicas', '1')):
+        """
+        Settings and mappings of the index, tuned to how the apps use each field.
+
+        Relation fields are split into keyword arrays by the default ingest pipeline. Tag fields stay
+        analyzed text because they are searched with fuzzy match queries. Display-only fields are kept
+        in _source but not indexed.
+
+        Returns:
+            dict: Body for indices.create (without aliases).
+        """
+        properties = {
+            'id': {'type': 'keyword'},
+            'status': {'type': 'keyword'},
+            'subject': {'type': 'text'},
+            'description': {'type': 'text', 'index': False, 'norms': False},
+            'all_notes': {'type': 'text', 'index': False, 'norms': False},
+            # Matched with a full-text query by prompt_app.count_field_in_updated_via
+            'updated_via': {'type': 'text'},
+            'likely_duplicates': {'type': 'keyword'},
+        }
+        for field in RELATION_FIELDS:
+            properties[field] = {'type': 'keyword'}
+        for field in [f for f in [search_field, search_field_2] if f and f not in RELATION_FIELDS]:
+            # Tags are matched with fuzziness, the keyword sub-field serves exact lookups and aggregations
+            properties[field] = {'type': 'text', 'fields': {'keyword': {'type': 'keyword', 'ignore_above': 256}}}
+        if vector_field and vector_dims:
+            properties[vector_field] = {
+                'type': 'dense_vector',
+                'dims': int(vector_dims),
+                'index': True,
+                'similarity': 'cosine',
+                'index_options': {'type': 'hnsw', 'm': 16, 'ef_construction': 100}
+            }
+
+        return {
+            'settings': {
+                'index': {
+                    'refresh_interval': refresh_interval,
+                    'number_of_replicas': int(number_of_replicas),
+                    'default_pipeline': RELATIONS_PIPELINE
+                }
+            },
+            'mappings': {'properties': properties}
+        }
+
+    def put_relations_pipeline(self):
+        """Ingest pipeline splitting comma/whitespace separated relation strings into arrays."""
+        processors = [
+            {
+                'split': {
+                    'field': field,
+                    'separator': '[,\\s;]+',
+                    'ignore_missing': True,
+                    'if': f"ctx.{field} instanceof String && ctx.{field}.trim() != ''"
+                }
+            } for field in RELATION_FIELDS
+        ]
+        self.es.ingest.put_pipeline(id=RELATIONS_PIPELINE, description='Split relation strings into ID arrays',
+                                    processors=processors)
+
+    def create_index(self, name, aliases=None, **settings_overrides):
+        self.put_relations_pipeline()
+        body = self.index_definition()
+        body['settings']['index'].update(settings_overrides)
+        if aliases:
+            body['aliases'] = {alias: {} for alias in aliases}
+        return self.es.indices.create(index=name, **body)
 
     def get_record_by_id(self, record_id):
+        from elasticsearch.exceptions import NotFoundError
+
         try:
             return self.es.get(index=self.index_name, id=record_id)
         except NotFoundError:
@@ -79,7 +279,7 @@ class Elasticsearch:
 
         return self.es.search(index=self.index_name, body=mlt_query)
     
-    def search_by_terms(self, field_name, terms, record, exclude_ids=None):
+    def search_by_terms(self, field_name, terms, record, exclude_ids=None, request_timeout=None):
         query = {
             "query": {
                 "bool": {
@@ -111,7 +311,8 @@ class Elasticsearch:
             },
             "size": self.size 
         }
-        return self.es.search(index=self.index_name, body=query)
+        es = self.es.options(request_timeout=request_timeout) if request_timeout else self.es
+        return es.search(index=self.index_name, body=query)
     
     def get_ids_from_search_results(self, search_results):
         """
@@ -129,7 +330,43 @@ class Elasticsearch:
 
         return list(set(ids))
     
-    def search_by_embedding(self, field: str, query_vector: list, size: int = 5):
+    def is_vector_field_indexed(self, field):
+        """Whether field is a dense_vector with an HNSW index, so it can be searched with knn."""
+        if field not in self._vector_field_indexed:
+            response = self.es.indices.get_field_mapping(index=self.index_name, fields=field)
+            definitions = [
+                next(iter(index_mapping['mappings'].get(field, {}).get('mapping', {}).values()), {})
+                for index_mapping in response.body.values()
+            ]
+            # knn needs the HNSW graph in every index behind the alias
+            self._vector_field_indexed[field] = bool(definitions) and all(
+                definition.get('type') == 'dense_vector' and definition.get('index', False)
+                for definition in definitions
+            )
+        return self._vector_field_indexed[field]
+
+    def search_by_embedding(self, field: str, query_vector: list, size: int = 5, request_timeout: float = None,
+                            num_candidates: int = int(os.environ.get('knn_num_candidates', '100'))):
+        """
+        Nearest neighbours of query_vector.
+
+        Uses an approximate knn search on the HNSW graph if the field is indexed, otherwise an exact
+        script_score over all documents.
+        """
+        es = self.es.options(request_timeout=request_timeout) if request_timeout else self.es
+        try:
+            if self.is_vector_field_indexed(field):
+                return es.search(index=self.index_name, size=size, knn={
+                    "field": field,
+                    "query_vector": query_vector,
+                    "k": size,
+                    "num_candidates": max(size, num_candidates)
+                })
+        except Exception as e:
+            # The alias may point to a reindexed index with another mapping now, so check it again next time
+            print(f"knn search on {field} failed, falling back to script_score: {e}")
+            self._vector_field_indexed.pop(field, None)
+
         search_query = {
             "size": size,
             "query": {
@@ -153,10 +390,127 @@ class Elasticsearch:
             }
         }
         # Execute the search query
+        response = None
         try:
-            response = self.es.search(index=self.index_name, body=search_query)
+            response = es.search(index=self.index_name, body=search_query)
         except Exception as e:
             print(e)
 
         # Extract and return the results
         return response
+
+    def hybrid_search(self, field_name, terms, record, vector_field=os.environ.get('vector_field'), exclude_ids=None,
+                      fusion=os.environ.get('hybrid_fusion', 'rrf'),
+                      lexical_timeout=float(os.environ.get('hybrid_lexical_timeout', '2.0')),
+                      vector_timeout=float(os.environ.get('hybrid_vector_timeout', '0.5')),
+                      rrf_k=60, vector_weight=float(os.environ.get('hybrid_vector_weight', '0.5'))):
+        """
+        Run the tag-based and the vector search concurrently and fuse their rankings.
+
+        Each leg has its own deadline. A leg that fails or misses its deadline is dropped,
+        so a slow vector leg degrades to lexical-only results instead of delaying the page.
+
+        Args:
+            field_name (str): Field holding the tags (same as for search_by_terms).
+            terms (list): Tags to search for.
+            record (dict): Source of the searched record (needs 'subject' and optionally the vector field).
+            vector_field (str): Field holding the embedding; the vector leg is skipped if empty.
+            exclude_ids (list): List of document IDs to exclude (default: None).
+            fusion (str): 'rrf' for reciprocal rank fusion or 'weighted' for min-max normalized scores.
+            lexical_timeout (float): Deadline of the lexical leg in seconds.
+            vector_timeout (float): Deadline of the vector leg in seconds.
+            rrf_k (int): Rank constant of reciprocal rank fusion.
+            vector_weight (float): Weight of the vector leg for the 'weighted' fusion (0..1).
+
+        Returns:
+            dict: Search results shaped like an Elasticsearch response, so existing renderers can display them.
+                  The names of the legs that contributed are listed under 'legs', the ones that were
+                  started under 'attempted_legs' (no vector leg for a record without embedding).
+        """
+        query_vector = record.get(vector_field) if vector_field else None
+        size = int(self.size or 10)
+
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=2)
+        futures = {
+            'lexical': executor.submit(self.search_by_terms, field_name, terms, record, exclude_ids,
+                                       lexical_timeout)
+        }
+        if query_vector:
+            # Fetch a few more hits, the searched record itself is filtered out after fusion
+            futures['vector'] = executor.submit(self.search_by_embedding, vector_field, query_vector,
+                                                size + len(exclude_ids or []), vector_timeout)
+
+        leg_results = {}
+        for leg, future in futures.items():
+            # Deadlines count from the start of the search, not from the end of the previous leg
+            timeout = lexical_timeout if leg == 'lexical' else vector_timeout
+            try:
+                response = future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+            except FutureTimeoutError:
+                print(f"hybrid_search: {leg} leg missed its deadline of {timeout}s")
+                continue
+            except Exception as e:
+                print(f"hybrid_search: {leg} leg failed: {e}")
+                continue
+            if response:
+                leg_results[leg] = response.get('hits', {}).get('hits', [])
+        # Do not wait for a leg that missed its deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        exclude = set(exclude_ids or [])
+        if fusion == 'weighted':
+            weights = {'lexical': 1.0 - vector_weight, 'vector': vector_weight}
+            fused = self._fuse_weighted(leg_results, weights, exclude)
+        else:
+            fused = self._fuse_rrf(leg_results, rrf_k, exclude)
+
+        hits = fused[:size]
+        return {
+            'hits': {
+                'total': {'value': len(fused), 'relation': 'eq'},
+                'max_score': hits[0]['_score'] if hits else None,
+                'hits': hits
+            },
+            'legs': list(leg_results.keys()),
+            'attempted_legs': list(futures.keys())
+        }
+
+    @staticmethod
+    def _without_excluded(leg_results, exclude):
+        """Drop excluded hits before fusion, so they neither take a rank nor set the score range."""
+        return {leg: [hit for hit in hits if hit['_id'] not in exclude] for leg, hits in leg_results.items()}
+
+    @staticmethod
+    def _fuse_rrf(leg_results, rrf_k, exclude):
+        scores = {}
+        hits_by_id = {}
+        for hits in Elasticsearch._without_excluded(leg_results, exclude).values():
+            for rank, hit in enumerate(hits, start=1):
+                scores[hit['_id']] = scores.get(hit['_id'], 0.0) + 1.0 / (rrf_k + rank)
+                hits_by_id.setdefault(hit['_id'], hit)
+        return Elasticsearch._build_fused_hits(scores, hits_by_id)
+
+    @staticmethod
+    def _fuse_weighted(leg_results, weights, exclude):
+        scores = {}
+        hits_by_id = {}
+        for leg, hits in Elasticsearch._without_excluded(leg_results, exclude).items():
+            hit_scores = [hit['_score'] or 0.0 for hit in hits]
+            if not hit_scores:
+                continue
+            low, high = min(hit_scores), max(hit_scores)
+            for hit, score in zip(hits, hit_scores):
+                normalized = (score - low) / (high - low) if high > low else 1.0
+                scores[hit['_id']] = scores.get(hit['_id'], 0.0) + weights.get(leg, 0.0) * normalized
+                hits_by_id.setdefault(hit['_id'], hit)
+        return Elasticsearch._build_fused_hits(scores, hits_by_id)
+
+    @staticmethod
+    def _build_fused_hits(scores, hits_by_id):
+        fused = []
+        for doc_id in sorted(scores, key=scores.get, reverse=True):
+            hit = dict(hits_by_id[doc_id])
+            hit['_score'] = scores[doc_id]
+            fused.append(hit)
+        return fused
@@ -0,0 +1,559 @@
+"""
+Load test for the Streamlit apps (app.py and prompt_app.py).
+
+For every session count a fresh `streamlit run --server.headless true` process is started
+against a local Elasticsearch stand-in with configurable latency. N simulated triagers connect
+to it over the same websocket protocol the browser uses, enter issue IDs, toggle tags and change
+boosts with random think times in between.
+
+Per session count the rerun latency percentiles (request sent until script finished), the CPU
+used by the app process and its memory growth per session are recorded, which gives a capacity
+curve to size deployments with. The size of st.session_state (item_states and widget keys) is
+measured separately by replaying a session with streamlit's AppTest runner in its own process.
+
+Usage:
+    python load_test.py --app app.py --sessions 1,2,4,8,16 --duration 30 --latency 0.02
+
+Requires streamlit >= 1.28 (streamlit.testing.v1) and aiohttp. CPU and memory of the app
+process are read from /proc, so they are only reported on Linux.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import pickle
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INDEX_NAME = "load_test"
+SEARCH_FIELD = "relations"
+SEARCH_FIELD_2 = "relations_sequence"
+
+
+def build_corpus(size, seed=0):
+    """Build a synthetic corpus shaped like the forge index."""
+    rng = random.Random(seed)
+    words = ["backend", "frontend", "cache", "extbase", "fluid", "install", "scheduler", "workspace",
+             "routing", "felogin", "indexed_search", "rte", "ckeditor", "filelist", "dashboard", "form"]
+    corpus = {}
+    for number in range(1, size + 1):
+        doc_id = str(100000 + number)
+        corpus[doc_id] = {
+            "id": doc_id,
+            "status": rng.choice(["New", "Closed", "Resolved", "Accepted", "Needs Feedback"]),
+            "subject": " ".join(rng.sample(words, 5)),
+            "description": " ".join(rng.choices(words, k=80)),
+            SEARCH_FIELD: rng.sample(words, rng.randint(2, 6)),
+            SEARCH_FIELD_2: rng.sample(words, rng.randint(0, 3)),
+            "relations_dupe": ",".join(str(100000 + rng.randint(1, size)) for _ in range(rng.randint(0, 2))),
+            "updated_via": SEARCH_FIELD,
+        }
+    return corpus
+
+
+class FakeElasticsearchHandler(BaseHTTPRequestHandler):
+    """Answers the subset of the Elasticsearch API the apps use, after a configurable delay."""
+
+    server_version = "FakeElasticsearch/8.9.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        latency = self.server.latency
+        if latency > 0:
+            time.sleep(max(0.0, random.gauss(latency, latency * self.server.jitter)))
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        # The official client refuses to talk to servers without this header
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _hit(self, doc_id, score=1.0):
+        return {"_index": INDEX_NAME, "_id": doc_id, "_score": score, "_source": self.server.corpus[doc_id]}
+
+    def do_HEAD(self):
+        self._delay()
+        self._send(200)
+
+    def do_PUT(self):
+        self._delay()
+        self._send(200, {"acknowledged": True, "index": INDEX_NAME})
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        self._delay()
+        path = self.path.split("?")[0]
+        body = self._read_body()
+        corpus = self.server.corpus
+
+        doc_match = re.match(r"^/[^/]+/_doc/(.+)$", path)
+        if doc_match:
+            doc_id = doc_match.group(1)
+            if doc_id in corpus:
+                self._send(200, dict(self._hit(doc_id), found=True, _version=1))
+            else:
+                self._send(404, {"_index": INDEX_NAME, "_id": doc_id, "found": False})
+        elif path.endswith("/_count"):
+            self._send(200, {"count": len(corpus)})
+        elif path.endswith("/_search"):
+            self._send(200, self._search(body))
+        else:
+            self._send(200, {"name": "fake", "cluster_name": "load_test", "version": {"number": "8.9.0"},
+                             "tagline": "You Know, for Search"})
+
+    def _search(self, body):
+        size = int(body.get("size") or 10)
+        ids = random.sample(self.server.corpus_ids, min(size, len(self.server.corpus_ids)))
+        hits = [self._hit(doc_id, score=1.0 / rank) for rank, doc_id in enumerate(ids, start=1)]
+        return {
+            "took": int(self.server.latency * 1000),
+            "timed_out": False,
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "max_score": 1.0 if hits else None,
+                     "hits": hits},
+        }
+
+
+class FakeElasticsearchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, corpus, latency=0.02, jitter=0.25, port=0):
+        super().__init__(("127.0.0.1", port), FakeElasticsearchHandler)
+        self.corpus = corpus
+        self.corpus_ids = list(corpus.keys())
+        self.latency = latency
+        self.jitter = jitter
+
+    def handle_error(self, request, client_address):
+        # Apps drop their connections when a session or the server stops, that is not an error
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+def app_environment(app, port):
+    """
+    Environment pointing the app to the stand-in.
+
+    app.py builds the URL from host and port, prompt_app.py expects the full URL in elasticsearch_host.
+    Environment variables win over .env because load_dotenv does not override them.
+    """
+    env = dict(os.environ)
+    env.update({
+        "index_name": INDEX_NAME,
+        "elasticsearch_port": str(port),
+        "elasticsearch_username": "",
+        "elasticsearch_password": "",
+        "search_field": SEARCH_FIELD,
+        "search_field_2": SEARCH_FIELD_2,
+        "result_count": os.environ.get("result_count", "10"),
+    })
+    if os.path.basename(app) == "prompt_app.py":
+        env["elasticsearch_host"] = f"http://127.0.0.1:{port}"
+    else:
+        env["elasticsearch_host"] = "127.0.0.1"
+    return env
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class StreamlitServer:
+    """A headless `streamlit run` process of one app."""
+
+    def __init__(self, app, env, startup_timeout=60.0):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "streamlit", "run", app,
+             "--server.headless", "true",
+             "--server.port", str(self.port),
+             "--server.address", "127.0.0.1",
+             # The simulated sessions do not fetch the XSRF cookie a browser gets with the page
+             "--server.enableXsrfProtection", "false",
+             "--browser.gatherUsageStats", "false"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self._wait_until_healthy(startup_timeout)
+
+    def _wait_until_healthy(self, timeout):
+        import urllib.request
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"streamlit exited with code {self.process.returncode}")
+            try:
+                with urllib.request.urlopen(f"{self.url}/_stcore/health", timeout=1) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"streamlit did not become healthy within {timeout}s")
+
+    def cpu_seconds(self):
+        """User + system CPU time of the app process (Linux only, None elsewhere)."""
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as handle:
+                # The command name may contain spaces, the fields after it are fixed
+                fields = handle.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def rss_bytes(self):
+        """Resident memory of the app process (Linux only, None elsewhere)."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as handle:
+                for line in handle:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class Widget:
+    def __init__(self, widget_type, proto, in_sidebar):
+        self.type = widget_type
+        self.id = proto.id
+        self.label = proto.label
+        self.in_sidebar = in_sidebar
+        self.default = getattr(proto, "default", None)
+        self.disabled = getattr(proto, "disabled", False)
+
+
+class WebSocketSession:
+    """One simulated triager talking to the app like a browser tab does."""
+
+    WIDGET_TYPES = ("text_input", "checkbox", "number_input")
+
+    def __init__(self, app, corpus_ids, think_time, timeout, seed):
+        self.app = app
+        self.corpus_ids = corpus_ids
+        self.think_time = think_time
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.widgets = {}
+        # Widget values set by this session, sent with every rerun like the frontend does
+        self.widget_states = {}
+        self.latencies = []
+        self.errors = 0
+        self.websocket = None
+
+    async def connect(self, http_session, url):
+        self.websocket = await http_session.ws_connect(
+            url.replace("http://", "ws://") + "/_stcore/stream", max_msg_size=0
+        )
+
+    async def _rerun(self):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+
+        started = time.perf_counter()
+        try:
+            ok = await asyncio.wait_for(self._read_until_finished(message), self.timeout)
+        except asyncio.TimeoutError:
+            ok = False
+        self.latencies.append(time.perf_counter() - started)
+        if not ok:
+            self.errors += 1
+
+    async def _read_until_finished(self, message):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        await self.websocket.send_bytes(message.SerializeToString())
+        widgets = {}
+        ok = True
+        async for frame in self.websocket:
+            forward = ForwardMsg()
+            forward.ParseFromString(frame.data)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    ok = False
+                elif element_type in self.WIDGET_TYPES:
+                    in_sidebar = forward.metadata.delta_path[0] == 1
+                    widget = Widget(element_type, getattr(element, element_type), in_sidebar)
+                    widgets[widget.id] = widget
+            elif kind == "script_finished":
+                if forward.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                self.widgets = widgets
+                self.widget_states = {key: value for key, value in self.widget_states.items() if key in widgets}
+                return ok and forward.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY
+        return False
+
+    def _find(self, widget_type, predicate):
+        # Like a browser user, leave disabled widgets alone
+        return [w for w in self.widgets.values() if w.type == widget_type and not w.disabled and predicate(w)]
+
+    def _enter_id(self):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widgets = self._find("text_input", lambda w: w.label.startswith("Enter"))
+        if widgets:
+            self.widget_states[widgets[0].id] = WidgetState(
+                id=widgets[0].id, string_value=self.rng.choice(self.corpus_ids)
+            )
+
+    def _toggle_tag(self):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        checkboxes = self._find("checkbox", lambda w: w.in_sidebar and w.label != "debug")
+        if checkboxes:
+            checkbox = self.rng.choice(checkboxes)
+            current = self.widget_states.get(checkbox.id)
+            value = current.bool_value if current is not None else checkbox.default
+            self.widget_states[checkbox.id] = WidgetState(id=checkbox.id, bool_value=not value)
+
+    def _change_boost(self):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        boosts = self._find("number_input", lambda w: w.in_sidebar and w.label.endswith("_boost"))
+        if boosts:
+            boost = self.rng.choice(boosts)
+            self.widget_states[boost.id] = WidgetState(
+                id=boost.id, double_value=round(self.rng.uniform(0.0, 2.0), 6)
+            )
+
+    async def run(self, http_session, url, stop_at):
+        await self.connect(http_session, url)
+        try:
+            await self._rerun()
+            self._enter_id()
+            await self._rerun()
+            actions = [self._enter_id, self._toggle_tag, self._toggle_tag, self._change_boost]
+            while time.monotonic() < stop_at:
+                if self.think_time > 0:
+                    await asyncio.sleep(self.rng.expovariate(1.0 / self.think_time))
+                self.rng.choice(actions)()
+                await self._rerun()
+        finally:
+            await self.websocket.close()
+
+
+async def drive_sessions(url, pool, duration):
+    import aiohttp
+
+    stop_at = time.monotonic() + duration
+    async with aiohttp.ClientSession() as http_session:
+        await asyncio.gather(*(session.run(http_session, url, stop_at) for session in pool))
+
+
+def run_level(app, sessions, duration, think_time, corpus_ids, timeout, es_port):
+    """Start a fresh app process, run `sessions` concurrent sessions for `duration` seconds and measure."""
+    server = StreamlitServer(app, app_environment(app, es_port))
+    try:
+        # One throwaway session first, so the app's imports and caches are not counted per session
+        asyncio.run(drive_sessions(server.url, [WebSocketSession(app, corpus_ids, 0, timeout, -1)], 0))
+        pool = [WebSocketSession(app, corpus_ids, think_time, timeout, seed) for seed in range(sessions)]
+        rss_before = server.rss_bytes()
+        cpu_before = server.cpu_seconds()
+        wall_started = time.perf_counter()
+        asyncio.run(drive_sessions(server.url, pool, duration))
+        wall = time.perf_counter() - wall_started
+        cpu_after = server.cpu_seconds()
+        rss_after = server.rss_bytes()
+    finally:
+        server.stop()
+
+    latencies = [latency for session in pool for latency in session.latencies]
+    cpu = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    rss_growth = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+    return {
+        "app": os.path.basename(app),
+        "sessions": sessions,
+        "reruns": len(latencies),
+        "reruns_per_second": round(len(latencies) / wall, 2) if wall else 0.0,
+        "errors": sum(session.errors for session in pool),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        "cpu_cores": round(cpu / wall, 2) if cpu is not None and wall else None,
+        "rss_mb": round(rss_after / 1024 / 1024, 1) if rss_after is not None else None,
+        "rss_kb_per_session": round(rss_growth / 1024 / sessions, 1) if rss_growth is not None else None,
+    }
+
+
+def value_size(value):
+    """Approximate memory footprint of a session state value."""
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def session_state_size(app_test):
+    """
+    Size of st.session_state of an AppTest session, including keyless widget values.
+
+    AppTest exposes wrappers around the SessionState (with SafeSessionState in between), which
+    are not iterable, so the keys are taken from the innermost SessionState.
+
+    Returns:
+        dict: Number of keys, total bytes and bytes of item_states.
+    """
+    state = app_test.session_state
+    while not hasattr(type(state), "_keys"):
+        state = object.__getattribute__(state, "_state")
+    sizes = {}
+    for key in state._keys():
+        try:
+            sizes[key] = value_size(key) + value_size(state[key])
+        except KeyError:
+            # Value of a widget that is no longer rendered
+            continue
+    return {
+        "keys": len(sizes),
+        "bytes": sum(sizes.values()),
+        "item_states_bytes": sizes.get("item_states", 0),
+    }
+
+
+def probe_session_state(app, corpus_ids, steps=20, seed=0, timeout=30.0):
+    """Replay one session with AppTest and return the session state size at the end."""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    at = AppTest.from_file(app, default_timeout=timeout).run()
+
+    def enter_id():
+        widgets = [w for w in at.text_input if w.label.startswith("Enter") and not w.disabled]
+        if widgets:
+            widgets[0].input(rng.choice(corpus_ids))
+
+    def toggle_tag():
+        checkboxes = [w for w in at.sidebar.checkbox if w.label != "debug" and not w.disabled]
+        if checkboxes:
+            checkbox = rng.choice(checkboxes)
+            checkbox.set_value(not checkbox.value)
+
+    def change_boost():
+        boosts = [w for w in at.sidebar.number_input if w.label.endswith("_boost") and not w.disabled]
+        if boosts:
+            rng.choice(boosts).set_value(round(rng.uniform(0.0, 2.0), 6))
+
+    enter_id()
+    at.run()
+    for _ in range(steps):
+        rng.choice([enter_id, toggle_tag, toggle_tag, change_boost])()
+        at.run()
+    return session_state_size(at)
+
+
+def probe_in_subprocess(app, es_port, corpus_size, timeout):
+    """Run probe_session_state in its own process, so AppTest gets the app environment at import."""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--probe", app, "--es-port", str(es_port),
+         "--corpus-size", str(corpus_size), "--timeout", str(timeout)],
+        env=app_environment(app, es_port), capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"session state probe of {app} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the TYPO3 forge Streamlit apps.")
+    parser.add_argument("--app", action="append", help="App to test (app.py, prompt_app.py), repeatable")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="Comma separated concurrent session counts")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per session count")
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean think time between actions (seconds)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean latency of the ES stand-in (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Latency standard deviation relative to mean")
+    parser.add_argument("--corpus-size", type=int, default=2000, help="Number of synthetic issues")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout of a single rerun (seconds)")
+    parser.add_argument("--output", help="Write the capacity curve as CSV to this file")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--es-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.corpus_size)
+    if args.probe:
+        # Internal: session state probe against an already running stand-in
+        print(json.dumps(probe_session_state(args.probe, list(corpus.keys()), timeout=args.timeout)))
+        return
+
+    server = FakeElasticsearchServer(corpus, latency=args.latency, jitter=args.jitter).start()
+    port = server.server_address[1]
+
+    results = []
+    for app in args.app or ["app.py", "prompt_app.py"]:
+        session_state = probe_in_subprocess(app, port, args.corpus_size, args.timeout)
+        for sessions in [int(value) for value in args.sessions.split(",") if value.strip()]:
+            result = run_level(app, sessions, args.duration, args.think_time, list(corpus.keys()),
+                               args.timeout, port)
+            result["session_state_keys"] = session_state["keys"]
+            result["session_state_kb"] = round(session_state["bytes"] / 1024, 1)
+            result["item_states_kb"] = round(session_state["item_states_bytes"] / 1024, 1)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+
+    server.shutdown()
+
+    if args.output and results:
+        with open(args.output, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()
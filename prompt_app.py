@@ -1,8 +1,12 @@
 import os
 import re
+import threading
 import streamlit as st
-from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
+from elasticsearch_module import build_similar_records_query, split_values
+from result_renderer import ElasticsearchResultRenderer
+from relation_graph import RelationGraph
+from warmup import warm_up_ids
 
 # Load environment variables from .env (if present)
 load_dotenv()
@@ -37,6 +41,10 @@ DEFAULT_SEARCH_FIELD_BOOST = float(os.getenv("search_field_boost", "0.2"))
 DEFAULT_SEARCH_FIELD_2_BOOST = float(os.getenv("search_field_2_boost", "0.000001"))
 
 SEARCH_FUNCTION = os.getenv("search_function", "search_similar_records")
+RENDER_CHUNK_SIZE = int(os.getenv("render_chunk_size", "20"))
+RELATION_GRAPH_PATH = os.getenv("relation_graph_path", "relation_graph.pickle")
+RELATION_HOPS = int(os.getenv("relation_hops", "1"))
+WARMUP_ON_START = env_to_bool(os.getenv("warmup_on_start", "False"))
 
 # We won't demonstrate multiple_evaluation_... usage here unless needed
 # but we read them to avoid possible errors
@@ -49,12 +57,50 @@ MULTIPLE_EVAL_SEARCH_FUNCTION = os.getenv("multiple_evaluation_search_function",
 
 class ElasticsearchClient:
     def __init__(self, host, username, password, index_name):
-        # Connect to Elasticsearch (no port or scheme passed separately)
-        self.client = Elasticsearch(
-            hosts=[host],
-            http_auth=(username, password)
-        )
+        self.host = host
+        self.http_auth = (username, password)
         self.index_name = index_name
+        # Created on first use (or by connect() in the background), so the first page is not blocked
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.connect()
+        return self._client
+
+    def connect(self):
+        """Import the client and connect to Elasticsearch (no port or scheme passed separately)."""
+        with self._client_lock:
+            if self._client is None:
+                from elasticsearch import Elasticsearch
+
+                client = Elasticsearch(
+                    hosts=[self.host],
+                    http_auth=self.http_auth
+                )
+                # Open the connection now rather than on the first search
+                client.info()
+                self._client = client
+        return self._client
+
+    def warm_up(self, record_ids=None):
+        """Run the configured search for representative records, so Elasticsearch caches are warm."""
+        for record_id in record_ids or warm_up_ids(self.client, self.index_name):
+            reference_record = self.get_document_by_id(record_id)
+            if not reference_record:
+                continue
+            getattr(self, SEARCH_FUNCTION, self.search_similar_records)(
+                reference_record=reference_record,
+                search_field_list=split_values(reference_record.get(SEARCH_FIELD)),
+                search_field_2_list=split_values(reference_record.get(SEARCH_FIELD_2)),
+                subject_boost=DEFAULT_SUBJECT_BOOST,
+                search_field_boost=DEFAULT_SEARCH_FIELD_BOOST,
+                search_field_2_boost=DEFAULT_SEARCH_FIELD_2_BOOST,
+                exclude_id=record_id,
+                result_count=RESULT_COUNT
+            )
 
     def count_documents(self):
         """Return total document count in the index."""
@@ -94,22 +140,16 @@ class ElasticsearchClient:
 
     def get_document_by_id(self, doc_id):
         """
-        Fetch the document by 'id' field (NOT by _id).
-        Adjust if you need to search by _id instead.
+        Fetch the document by _id (the issue ID).
+        Works with both the dynamic and the managed mapping, which has no 'id.keyword' sub-field.
         """
-        # If your 'id' is the _id, you can use get(index, id=doc_id).
-        # But if 'id' is a field, we do a search.
-        query = {
-            "query": {
-                "term": {
-                    "id.keyword": doc_id
-                }
-            }
-        }
-        resp = self.client.search(index=self.index_name, body=query, size=1)
-        if resp["hits"]["total"]["value"] > 0:
-            return resp["hits"]["hits"][0]["_source"]
-        return None
+        from elasticsearch.exceptions import NotFoundError
+
+        try:
+            resp = self.client.get(index=self.index_name, id=doc_id)
+        except NotFoundError:
+            return None
+        return resp["_source"]
 
     def search_similar_records(
         self,
@@ -131,61 +171,19 @@ class ElasticsearchClient:
         Exclude the reference record by 'exclude_id'.
         """
 
-        subject_value = reference_record.get("subject", "")
-
-        should_clauses = []
-
-        # Add subject clause (if not empty)
-        if subject_value.strip():
-            should_clauses.append({
-                "match": {
-                    "subject": {
-                        "query": subject_value,
-                        "boost": subject_boost
-                    }
-                }
-            })
-
-        # Add search_field items
-        for item in search_field_list:
-            if item.strip():
-                should_clauses.append({
-                    "match": {
-                        SEARCH_FIELD: {
-                            "query": item.strip(),
-                            "boost": search_field_boost
-                        }
-                    }
-                })
-
-        # Add search_field_2 items
-        for item in search_field_2_list:
-            if item.strip():
-                should_clauses.append({
-                    "match": {
-                        SEARCH_FIELD_2: {
-                            "query": item.strip(),
-                            "boost": search_field_2_boost
-                        }
-                    }
-                })
-
-        query_body = {
-            "query": {
-                "bool": {
-                    "must_not": [
-                        {"term": {"id.keyword": exclude_id}}
-                    ],
-                    "should": should_clauses
-                    # "minimum_should_match": 1  # if you only want docs that match at least one
-                }
-            },
-            "size": result_count
-        }
-
-        # If debug is True, we want to see explanation
-        if debug:
-            query_body["explain"] = True
+        query_body = build_similar_records_query(
+            reference_record,
+            SEARCH_FIELD,
+            search_field_list,
+            SEARCH_FIELD_2,
+            search_field_2_list,
+            subject_boost,
+            search_field_boost,
+            search_field_2_boost,
+            exclude_id,
+            result_count,
+            debug=debug
+        )
 
         response = self.client.search(index=self.index_name, body=query_body)
 
@@ -222,16 +220,70 @@ class ElasticsearchClient:
         )
 
 
-def main():
-    st.title("TYPO3 forge issues")
+def prepare_es_client(es_client):
+    try:
+        es_client.connect()
+        if WARMUP_ON_START:
+            es_client.warm_up()
+    except Exception as e:
+        # The first search connects again and shows the error on the page
+        print(f"Preparing Elasticsearch client failed: {e}")
 
-    # Instantiate our client
+
+@st.cache_resource
+def get_es_client():
+    """One client per process, connected (and optionally warmed up) in the background while the page renders."""
     es_client = ElasticsearchClient(
         host=ELASTICSEARCH_HOST,
         username=ELASTICSEARCH_USERNAME,
         password=ELASTICSEARCH_PASSWORD,
         index_name=INDEX_NAME
     )
+    threading.Thread(target=prepare_es_client, args=(es_client,), daemon=True).start()
+    return es_client
+
+
+@st.cache_resource
+def load_relation_graph(path):
+    """Relation graph built by relation_graph.py, shared by all sessions (None if not built)."""
+    if path and os.path.exists(path):
+        return RelationGraph.load(path)
+    return None
+
+
+def render_hit_markdown(i, hit, search_field, search_field_2, related_ids):
+    """Markdown of one result, related records are shown as a heading."""
+    record_id = hit["_source"].get("id", "")
+    record_subject = hit["_source"].get("subject", "")
+    record_score = hit["_score"]
+    sf_val = hit["_source"].get(search_field, "")
+    sf2_val = hit["_source"].get(search_field_2, "")
+    url_link = f"{FORGE_LINK_BASE}{record_id}"
+
+    # Check if record_id is in related_ids
+    if str(record_id) in related_ids:
+        return (
+            f"### **{i}) ID**: {record_id}, Score={record_score}\n"
+            f"**Subject**: {record_subject}\n"
+            f"[Link]({url_link})\n"
+            f"**{SEARCH_FIELD_DISPLAY_NAME}**: {sf_val}\n"
+            f"**{SEARCH_FIELD_2_DISPLAY_NAME}**: {sf2_val}\n\n"
+        )
+    # Normal smaller text
+    return (
+        f"**{i}) ID**: {record_id}, Score={record_score}\n\n"
+        f"Subject: {record_subject}\n\n"
+        f"[Link]({url_link})\n\n"
+        f"{SEARCH_FIELD_DISPLAY_NAME}: {sf_val}\n\n"
+        f"{SEARCH_FIELD_2_DISPLAY_NAME}: {sf2_val}\n\n"
+    )
+
+
+def main():
+    st.title("TYPO3 forge issues")
+
+    # Instantiate our client
+    es_client = get_es_client()
 
     # SIDEBAR: Show statistics if enabled
     if STATISTICS:
@@ -358,17 +410,30 @@ def main():
         relations_dupe = reference_record.get("relations_dupe", "")
 
         related_ids = set()
-        for rel_str in [relations, relations_seq, relations_dupe]:
-            if rel_str:
-                # split by whitespace or commas/semicolons
-                splitted = re.split(r"[,\s;]+", rel_str.strip())
-                # filter out empty strings
-                splitted = [x for x in splitted if x.strip()]
-                related_ids.update(splitted)
+        relation_graph = load_relation_graph(RELATION_GRAPH_PATH)
+        if relation_graph and search_id.strip() in relation_graph:
+            # Precomputed graph, includes links up to RELATION_HOPS away
+            related_ids = relation_graph.k_hop(search_id.strip(), RELATION_HOPS)
+        else:
+            for rel_str in [relations, relations_seq, relations_dupe]:
+                if isinstance(rel_str, list):
+                    # indices with managed mapping store relations as arrays already
+                    related_ids.update(str(x) for x in rel_str if str(x).strip())
+                elif rel_str:
+                    # split by whitespace or commas/semicolons
+                    splitted = re.split(r"[,\s;]+", rel_str.strip())
+                    # filter out empty strings
+                    splitted = [x for x in splitted if x.strip()]
+                    related_ids.update(splitted)
 
         # We'll show the unique related IDs
         st.markdown(f"**Related IDs from record**: {', '.join(related_ids) if related_ids else 'None'}")
 
+        # Precomputed by duplicate_detection.py
+        likely_duplicates = reference_record.get("likely_duplicates") or []
+        if likely_duplicates:
+            st.markdown(f"**Likely duplicates**: {', '.join(str(x) for x in likely_duplicates)}")
+
         # 3) The user can pick which items from search_field, search_field_2 to include
         #    We'll read them from the reference record to see what's present
         raw_field_values = reference_record.get(search_field, "")
@@ -454,39 +519,21 @@ def main():
         st.progress(fraction)
 
         # 7) Display the results
+        # Hits are formatted lazily and written in chunks instead of one st.markdown call per hit
         st.subheader("Results")
-        for i, hit in enumerate(hits, start=1):
-            record_id = hit["_source"].get("id", "")
-            record_subject = hit["_source"].get("subject", "")
-            record_score = hit["_score"]
-            sf_val = hit["_source"].get(search_field, "")
-            sf2_val = hit["_source"].get(search_field_2, "")
-            url_link = f"{FORGE_LINK_BASE}{record_id}"
-
-            # Check if record_id is in related_ids
-            if record_id in related_ids or str(record_id) in related_ids:
-                st.markdown(
-                    f"### **{i}) ID**: {record_id}, Score={record_score}\n"
-                    f"**Subject**: {record_subject}\n"
-                    f"[Link]({url_link})\n"
-                    f"**{SEARCH_FIELD_DISPLAY_NAME}**: {sf_val}\n"
-                    f"**{SEARCH_FIELD_2_DISPLAY_NAME}**: {sf2_val}"
-                )
-            else:
-                # Normal smaller text
-                st.markdown(
-                    f"**{i}) ID**: {record_id}, Score={record_score}\n\n"
-                    f"Subject: {record_subject}\n\n"
-                    f"[Link]({url_link})\n\n"
-                    f"{SEARCH_FIELD_DISPLAY_NAME}: {sf_val}\n\n"
-                    f"{SEARCH_FIELD_2_DISPLAY_NAME}: {sf2_val}"
-                )
-
-            # If debug is true, show explanation
-            if debug_flag:
+        rendered_hits = (
+            render_hit_markdown(i, hit, search_field, search_field_2, related_ids)
+            for i, hit in enumerate(hits, start=1)
+        )
+        if debug_flag:
+            for hit, hit_markdown in zip(hits, rendered_hits):
+                st.markdown(hit_markdown)
+                # If debug is true, show explanation
                 if "_explanation" in hit:
-                    with st.expander(f"Explanation for {record_id}"):
+                    with st.expander(f"Explanation for {hit['_source'].get('id', '')}"):
                         st.json(hit["_explanation"])
+        else:
+            ElasticsearchResultRenderer.stream_chunks(rendered_hits, st.markdown, RENDER_CHUNK_SIZE)
 
 if __name__ == "__main__":
     main()
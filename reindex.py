@@ -0,0 +1,123 @@
+"""
+Zero-downtime reindex into the managed mapping.
+
+Builds a new versioned index with the mapping from Elasticsearch.index_definition in the background
+(sliced parallel _reindex, no refreshes and replicas while copying), then atomically moves the
+index_name alias to it. If index_name is still a concrete index (created before the managed mapping),
+it is deleted and replaced by the alias in the same atomic step, which leaves nothing to roll back
+to, so this needs --delete-old or --replace-legacy-index.
+Documents written to the old index while the copy is running are not carried over, so pause
+the importer during a reindex.
+
+Usage:
+    python reindex.py [--slices auto] [--delete-old] [--replace-legacy-index]
+"""
+import argparse
+import os
+import sys
+import time
+
+from elasticsearch_module import Elasticsearch
+
+
+def wait_for_task(es, task_id, poll_interval=5):
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        status = task['task']['status']
+        print(f"Reindexed {status.get('created', 0) + status.get('updated', 0)}/{status.get('total', 0)} documents")
+        if task.get('completed'):
+            if task.get('error'):
+                raise RuntimeError(f"Reindex failed: {task['error']}")
+            failures = task.get('response', {}).get('failures', [])
+            if failures:
+                raise RuntimeError(f"Reindex failed for {len(failures)} documents, first: {failures[0]}")
+            return task
+        time.sleep(poll_interval)
+
+
+def reindex(es_client, slices='auto', delete_old=False, replace_legacy_index=False):
+    """
+    Copy index_name into a new versioned index and point the index_name alias to it.
+
+    Raises:
+        RuntimeError: If index_name is a concrete index and replacing it was not allowed,
+            or if the copy failed (the new index is deleted again).
+    """
+    es = es_client.es
+    alias = es_client.index_name
+
+    if es.indices.exists_alias(name=alias):
+        old_indices = list(es.indices.get_alias(name=alias).keys())
+        alias_is_index = False
+    else:
+        old_indices = [alias]
+        alias_is_index = True
+        if not (delete_old or replace_legacy_index):
+            raise RuntimeError(f"{alias} is a concrete index, which the alias swap deletes. "
+                               f"Pass --delete-old or --replace-legacy-index to replace it.")
+
+    new_index = es_client.versioned_index_name()
+    # Bulk-load friendly settings, restored once the copy is done
+    es_client.create_index(new_index, refresh_interval='-1', number_of_replicas=0)
+    print(f"Created {new_index}, copying from {', '.join(old_indices)}")
+
+    try:
+        response = es.reindex(
+            source={'index': old_indices},
+            # default_pipeline of the new index splits the relation strings on the way
+            dest={'index': new_index},
+            slices=int(slices) if str(slices).isdigit() else slices,
+            wait_for_completion=False
+        )
+        wait_for_task(es, response['task'])
+    except Exception:
+        # Do not leave a half-filled index with bulk-load settings behind
+        es.indices.delete(index=new_index, ignore_unavailable=True)
+        print(f"Deleted {new_index} after the failed copy")
+        raise
+
+    settings = es_client.index_definition()['settings']['index']
+    es.indices.put_settings(index=new_index, settings={
+        'refresh_interval': settings['refresh_interval'],
+        'number_of_replicas': settings['number_of_replicas']
+    })
+    es.indices.refresh(index=new_index)
+
+    if alias_is_index:
+        # An alias can not share the name of an index, so the old index is removed in the same atomic step
+        actions = [{'remove_index': {'index': alias}}]
+    else:
+        actions = [{'remove': {'index': index, 'alias': alias}} for index in old_indices]
+    actions.append({'add': {'index': new_index, 'alias': alias}})
+    es.indices.update_aliases(actions=actions)
+    print(f"Alias {alias} now points to {new_index}")
+
+    if alias_is_index:
+        print(f"Deleted legacy index {alias}")
+    elif delete_old:
+        es.indices.delete(index=','.join(old_indices))
+        print(f"Deleted {', '.join(old_indices)}")
+
+    return new_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reindex into the managed mapping and swap the alias.")
+    parser.add_argument("--index", default=os.environ.get('index_name'), help="Alias (or legacy index) to reindex")
+    parser.add_argument("--slices", default="auto", help="Number of parallel reindex slices or 'auto'")
+    parser.add_argument("--delete-old", action="store_true",
+                        help="Delete the previous index after the swap, also allows replacing a legacy index")
+    parser.add_argument("--replace-legacy-index", action="store_true",
+                        help="Allow replacing a concrete index named like the alias, it is deleted in the swap")
+    args = parser.parse_args()
+
+    try:
+        reindex(Elasticsearch(index_name=args.index), slices=args.slices, delete_old=args.delete_old,
+                replace_legacy_index=args.replace_legacy_index)
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Relation graph of the whole corpus, built once from the relations, relations_dupe and
+relations_sequence fields.
+
+Links are stored undirected as compact CSR integer arrays (indptr/indices plus an edge type
+bitmask), connected components are precomputed. Neighbour lookups are O(degree) and k-hop
+queries only touch the visited part of the graph, so the apps and batch evaluators do not
+need to parse relation strings at request time.
+
+Usage:
+    python relation_graph.py --output relation_graph.pickle
+"""
+import argparse
+import os
+import pickle
+from array import array
+from collections import defaultdict
+
+from elasticsearch_module import RELATION_FIELDS, split_values
+
+RELATIONS = 1
+RELATIONS_DUPE = 2
+RELATIONS_SEQUENCE = 4
+ALL_RELATIONS = RELATIONS | RELATIONS_DUPE | RELATIONS_SEQUENCE
+EDGE_TYPES = dict(zip(RELATION_FIELDS, [RELATIONS, RELATIONS_DUPE, RELATIONS_SEQUENCE]))
+
+
+class RelationGraph:
+    def __init__(self, ids, indptr, indices, edge_types, components):
+        self.ids = ids
+        self.node_of = {issue_id: node for node, issue_id in enumerate(ids)}
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_types = edge_types
+        self.components = components
+        self._build_component_index()
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build the graph from (issue_id, source) pairs.
+
+        Args:
+            records (iterable): Pairs of issue ID and a dict holding the relation fields.
+
+        Returns:
+            RelationGraph: The graph, linked issues outside the corpus are included as nodes.
+        """
+        node_of = {}
+        ids = []
+
+        def node(issue_id):
+            if issue_id not in node_of:
+                node_of[issue_id] = len(ids)
+                ids.append(issue_id)
+            return node_of[issue_id]
+
+        edges = defaultdict(int)
+        for issue_id, source in records:
+            source_node = node(str(issue_id))
+            for field, edge_type in EDGE_TYPES.items():
+                for other_id in split_values(source.get(field)):
+                    target_node = node(other_id)
+                    if target_node != source_node:
+                        edges[(source_node, target_node)] |= edge_type
+                        edges[(target_node, source_node)] |= edge_type
+
+        indptr = array('q', [0] * (len(ids) + 1))
+        for source_node, _ in edges:
+            indptr[source_node + 1] += 1
+        for position in range(len(ids)):
+            indptr[position + 1] += indptr[position]
+
+        indices = array('i', [0] * len(edges))
+        edge_types = array('b', [0] * len(edges))
+        fill = array('q', indptr[:-1])
+        for (source_node, target_node), edge_type in sorted(edges.items()):
+            indices[fill[source_node]] = target_node
+            edge_types[fill[source_node]] = edge_type
+            fill[source_node] += 1
+
+        return cls(ids, indptr, indices, edge_types, cls._connected_components(len(ids), indptr, indices))
+
+    @classmethod
+    def from_elasticsearch(cls, es_client):
+        from elasticsearch.helpers import scan
+
+        hits = scan(es_client.es, index=es_client.index_name, _source=RELATION_FIELDS, size=1000)
+        return cls.from_records((hit['_id'], hit['_source']) for hit in hits)
+
+    @staticmethod
+    def _connected_components(node_count, indptr, indices):
+        components = array('i', [-1] * node_count)
+        component = 0
+        for start in range(node_count):
+            if components[start] != -1:
+                continue
+            components[start] = component
+            stack = [start]
+            while stack:
+                current = stack.pop()
+                for target in indices[indptr[current]:indptr[current + 1]]:
+                    if components[target] == -1:
+                        components[target] = component
+                        stack.append(target)
+            component += 1
+        return components
+
+    def _build_component_index(self):
+        """CSR of the component members, so a component is listed without scanning all nodes."""
+        component_count = max(self.components, default=-1) + 1
+        self.component_indptr = array('q', [0] * (component_count + 1))
+        for component in self.components:
+            self.component_indptr[component + 1] += 1
+        for position in range(component_count):
+            self.component_indptr[position + 1] += self.component_indptr[position]
+        self.component_nodes = array('i', [0] * len(self.components))
+        fill = array('q', self.component_indptr[:-1])
+        for node, component in enumerate(self.components):
+            self.component_nodes[fill[component]] = node
+            fill[component] += 1
+
+    def __contains__(self, issue_id):
+        return str(issue_id) in self.node_of
+
+    def _neighbour_nodes(self, node, edge_types=ALL_RELATIONS):
+        for position in range(self.indptr[node], self.indptr[node + 1]):
+            if self.edge_types[position] & edge_types:
+                yield self.indices[position]
+
+    def neighbors(self, issue_id, edge_types=ALL_RELATIONS):
+        """Directly linked issues (in either direction), optionally restricted to some relation types."""
+        node = self.node_of.get(str(issue_id))
+        if node is None:
+            return []
+        return [self.ids[target] for target in self._neighbour_nodes(node, edge_types)]
+
+    def k_hop(self, issue_id, k=1, edge_types=ALL_RELATIONS):
+        """Issues reachable within k links, without the issue itself."""
+        node = self.node_of.get(str(issue_id))
+        if node is None:
+            return set()
+        visited = {node}
+        frontier = [node]
+        for _ in range(k):
+            next_frontier = []
+            for current in frontier:
+                for target in self._neighbour_nodes(current, edge_types):
+                    if target not in visited:
+                        visited.add(target)
+                        next_frontier.append(target)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        visited.discard(node)
+        return {self.ids[target] for target in visited}
+
+    def component_of(self, issue_id):
+        node = self.node_of.get(str(issue_id))
+        return None if node is None else self.components[node]
+
+    def component_members(self, issue_id):
+        """All issues transitively linked to issue_id (including itself)."""
+        component = self.component_of(issue_id)
+        if component is None:
+            return []
+        nodes = self.component_nodes[self.component_indptr[component]:self.component_indptr[component + 1]]
+        return [self.ids[node] for node in nodes]
+
+    def recall(self, issue_id, result_ids, k=1, edge_types=ALL_RELATIONS):
+        """
+        Share of the issues within k links that appear in result_ids.
+
+        Returns:
+            tuple: (found related IDs, all related IDs)
+        """
+        related = self.k_hop(issue_id, k, edge_types)
+        return related.intersection(str(result_id) for result_id in result_ids), related
+
+    def save(self, path):
+        with open(path, 'wb') as handle:
+            pickle.dump({
+                'ids': self.ids,
+                'indptr': self.indptr,
+                'indices': self.indices,
+                'edge_types': self.edge_types,
+                'components': self.components,
+            }, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as handle:
+            return cls(**pickle.load(handle))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the relation graph of the whole corpus.")
+    parser.add_argument("--output", default=os.environ.get('relation_graph_path', 'relation_graph.pickle'))
+    args = parser.parse_args()
+
+    from elasticsearch_module import Elasticsearch
+
+    graph = RelationGraph.from_elasticsearch(Elasticsearch())
+    graph.save(args.output)
+    print(f"Nodes: {len(graph.ids)}, links: {len(graph.indices) // 2}, "
+          f"components: {len(graph.component_indptr) - 1}, written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,23 +7,74 @@ class ElasticsearchResultRenderer:
         return f"https://forge.typo3.org/issues/{id}: {subject} ({status})"
 
     @staticmethod
-    def render_similar_results(results, extra_field='', highlight_ids=[]):
-        output = ""
+    def iter_similar_results(results, extra_field='', highlight_ids=()):
+        """Yield the markdown of each hit, in one pass over the results."""
+        highlight_ids = set(highlight_ids)
         for idx, hit in enumerate(results['hits']['hits'], start=1):
             id = hit['_id']
             status = hit['_source'].get('status', 'Unknown')
             score = hit['_score']
             subject = hit['_source'].get('subject', 'No Subject')
-            
+
             # Check if the current ID is in highlight_ids
             if id in highlight_ids:
-                output += f"> ##### {status} #{idx} ({score}): https://forge.typo3.org/issues/{id}: {subject}\n\n"
+                output = f"> ##### {status} #{idx} ({score}): https://forge.typo3.org/issues/{id}: {subject}\n\n"
             else:
-                output += f"{status} #{idx} ({score}): https://forge.typo3.org/issues/{id}: {subject}\n\n"
+                output = f"{status} #{idx} ({score}): https://forge.typo3.org/issues/{id}: {subject}\n\n"
 
             # Add the extra field if specified
             if extra_field:
                 extra_field_value = hit['_source'].get(extra_field, '')
                 output += f"{extra_field_value}\n\n"
-        
-        return output
+
+            yield output
+
+    @staticmethod
+    def similar_table_header(extra_field=''):
+        header = "| # | Status | Score | Issue | Subject |"
+        separator = "|---|---|---|---|---|"
+        if extra_field:
+            header += f" {extra_field} |"
+            separator += "---|"
+        return f"{header}\n{separator}\n"
+
+    @staticmethod
+    def iter_similar_table_rows(results, extra_field='', highlight_ids=()):
+        """Yield one compact markdown table row per hit, use similar_table_header() for the header."""
+        highlight_ids = set(highlight_ids)
+        for idx, hit in enumerate(results['hits']['hits'], start=1):
+            id = hit['_id']
+            status = hit['_source'].get('status', 'Unknown')
+            score = hit['_score']
+            subject = ElasticsearchResultRenderer._table_cell(hit['_source'].get('subject', 'No Subject'))
+            marker = '**' if id in highlight_ids else ''
+            row = (f"| {marker}{idx}{marker} | {status} | {score:.3f} | "
+                   f"[{id}](https://forge.typo3.org/issues/{id}) | {marker}{subject}{marker} |")
+            if extra_field:
+                row += f" {ElasticsearchResultRenderer._table_cell(hit['_source'].get(extra_field, ''))} |"
+            yield row + "\n"
+
+    @staticmethod
+    def _table_cell(value):
+        if isinstance(value, list):
+            value = ', '.join(str(item) for item in value)
+        return str(value).replace('|', '\\|').replace('\n', ' ')
+
+    @staticmethod
+    def render_similar_results(results, extra_field='', highlight_ids=()):
+        return "".join(ElasticsearchResultRenderer.iter_similar_results(results, extra_field, highlight_ids))
+
+    @staticmethod
+    def stream_chunks(parts, write, chunk_size=20, header=''):
+        """
+        Pass the rendered parts to write() in chunks of chunk_size, so the first results show up
+        before the last ones are formatted. The header (e.g. of a table) starts every chunk.
+        """
+        chunk = [header]
+        for part in parts:
+            chunk.append(part)
+            if len(chunk) > chunk_size:
+                write("".join(chunk))
+                chunk = [header]
+        if len(chunk) > 1:
+            write("".join(chunk))
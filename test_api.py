@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("elasticsearch")
+
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from api import MAX_RESULT_COUNT, SimilarIssuesApi  # noqa: E402
+
+
+class FakeAsyncElasticsearch:
+    """Answers get/mget/msearch for issues 1 to 5."""
+
+    def __init__(self):
+        self.msearch_calls = 0
+
+    @staticmethod
+    def _source(issue_id):
+        return {"subject": f"Issue {issue_id}", "relations": "1,2"}
+
+    async def get(self, index, id):
+        return {"_id": id, "_source": self._source(id)}
+
+    async def mget(self, index, ids, source_includes=None):
+        return {"docs": [{"_id": issue_id, "found": issue_id in "12345", "_source": self._source(issue_id)}
+                         for issue_id in ids]}
+
+    async def search(self, index, body):
+        return {"hits": {"hits": [{"_id": "2", "_score": 1.0, "_source": {"subject": "Issue 2"}}]}}
+
+    async def msearch(self, index, searches):
+        self.msearch_calls += 1
+        return {"responses": [await self.search(index, query) for query in searches[1::2]]}
+
+    async def close(self):
+        pass
+
+
+def request(method, path, **kwargs):
+    async def run():
+        api = SimilarIssuesApi.__new__(SimilarIssuesApi)
+        api.es = FakeAsyncElasticsearch()
+        api.index_name = "test"
+        async with TestClient(TestServer(api.application())) as client:
+            response = await client.request(method, path, **kwargs)
+            return response.status, await response.text(), api.es
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("payload", [
+    {"ids": "12"},
+    {"lookups": "12"},
+    {"lookups": [1, 2]},
+    {"lookups": [{"tags": ["a"]}]},
+    {"ids": [1], "size": None},
+    {"ids": [1], "size": MAX_RESULT_COUNT + 1},
+    {"ids": [1], "size": "ten"},
+    {"lookups": [{"id": 1}, {"id": 2, "subject_boost": [1]}]},
+    {"ids": [1], "tags": {"a": 1}},
+    [1, 2],
+])
+def test_batch_rejects_invalid_payload_before_streaming(payload):
+    status, body, es = request("POST", "/similar/batch", json=payload)
+    assert status == 400
+    assert "error" in json.loads(body)
+    assert es.msearch_calls == 0
+
+
+def test_batch_streams_one_line_per_lookup():
+    status, body, es = request("POST", "/similar/batch", json={
+        "lookups": [{"id": 1}, {"id": "9"}, {"id": 3, "tags": ["x"], "size": 5}],
+        "subject_boost": 2,
+    })
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert status == 200
+    assert [line["id"] for line in lines] == ["1", "9", "3"]
+    assert lines[1]["error"] == "not found"
+    assert lines[2]["results"][0]["id"] == "2"
+
+
+def test_similar_rejects_invalid_query_parameters():
+    status, _, _ = request("GET", "/similar/1?size=0")
+    assert status == 400
+    status, _, _ = request("GET", "/similar/1?subject_boost=nan")
+    assert status == 400
+    status, body, _ = request("GET", "/similar/1?size=3&subject_boost=0.5")
+    assert status == 200
+    assert json.loads(body)["results"][0]["id"] == "2"
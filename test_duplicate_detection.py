@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("elasticsearch")
+
+from duplicate_detection import DuplicateDetector  # noqa: E402
+
+
+def test_changed_lists_skips_unchanged_and_clears_stale():
+    likely_duplicates = {"1": ["2"], "2": ["1"], "3": ["4", "5"]}
+    stored = {"1": ["2"], "2": [], "3": ["5", "4"], "6": ["7"], "7": []}
+    assert DuplicateDetector.changed_lists(likely_duplicates, stored) == {
+        "2": ["1"],
+        "3": ["4", "5"],
+        "6": [],
+    }
+
+
+def test_find_duplicate_pairs_and_clusters():
+    detector = DuplicateDetector(es_client=object(), tags_field="tags", threshold=0.5)
+    shingles = {
+        "1": detector.shingles({"subject": "Backend login fails with SSO", "tags": "login,sso"}),
+        "2": detector.shingles({"subject": "Backend login fails with SSO", "tags": "login"}),
+        "3": detector.shingles({"subject": "Page tree drag and drop", "tags": "pagetree"}),
+    }
+    pairs, _ = detector.find_duplicate_pairs(shingles)
+    assert set(pairs) == {("1", "2")}
+    assert detector.build_clusters(pairs) == [["1", "2"]]
+
+
+def test_shingles_tolerate_missing_subject_and_non_string_tags():
+    detector = DuplicateDetector(es_client=object(), tags_field="tags")
+    assert detector.shingles({"subject": None, "tags": [12, None, " Extbase "]}) == {"tag:12", "tag:extbase"}
+    assert detector.shingles({"subject": None, "tags": 7}) == {"tag:7"}
+    assert detector.shingles({"tags": "Page tree, Backend"}) == {"tag:page tree", "tag:backend"}
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+from elasticsearch_module import Elasticsearch
+
+
+class FakeClient:
+    def __init__(self, vector_mapping):
+        self.vector_mapping = vector_mapping
+        self.knn_error = None
+        self.searches = []
+        self.indices = SimpleNamespace(get_field_mapping=self.get_field_mapping)
+
+    def get_field_mapping(self, index, fields):
+        mappings = {fields: {'full_name': fields, 'mapping': {fields: self.vector_mapping}}}
+        return SimpleNamespace(body={'issues_20240101000000': {'mappings': mappings}})
+
+    def options(self, **kwargs):
+        return self
+
+    def search(self, **kwargs):
+        self.searches.append(kwargs)
+        if 'knn' in kwargs and self.knn_error:
+            raise self.knn_error
+        return {'hits': {'hits': []}}
+
+
+def client_with(vector_mapping):
+    client = Elasticsearch(index_name='issues')
+    client._es = FakeClient(vector_mapping)
+    client._connected = True
+    return client
+
+
+def test_updated_via_stays_text_for_match_queries():
+    properties = Elasticsearch.index_definition()['mappings']['properties']
+    assert properties['updated_via'] == {'type': 'text'}
+
+
+def test_search_by_embedding_uses_knn_on_indexed_field():
+    client = client_with({'type': 'dense_vector', 'dims': 3, 'index': True})
+    client.search_by_embedding('embedding', [0.1, 0.2, 0.3], size=7, request_timeout=0.5)
+    search = client.es.searches[-1]
+    assert search['knn']['field'] == 'embedding'
+    assert search['knn']['k'] == 7
+    assert search['knn']['num_candidates'] >= 7
+    assert 'body' not in search
+
+
+def test_search_by_embedding_falls_back_to_script_score():
+    client = client_with({'type': 'dense_vector', 'dims': 3})
+    client.search_by_embedding('embedding', [0.1, 0.2, 0.3], size=7)
+    assert 'script_score' in client.es.searches[-1]['body']['query']
+
+
+def test_search_by_embedding_falls_back_when_knn_fails():
+    client = client_with({'type': 'dense_vector', 'dims': 3, 'index': True})
+    client.es.knn_error = RuntimeError("field is not indexed")
+    response = client.search_by_embedding('embedding', [0.1, 0.2, 0.3], size=7)
+    assert response == {'hits': {'hits': []}}
+    assert 'script_score' in client.es.searches[-1]['body']['query']
+
+    # The mapping is looked up again, e.g. after the alias moved to a reindexed index
+    client.es.vector_mapping = {'type': 'dense_vector', 'dims': 3}
+    client.search_by_embedding('embedding', [0.1, 0.2, 0.3], size=7)
+    assert 'knn' not in client.es.searches[-1]
+
+def test_fuse_rrf_ranks_without_excluded_hits():
+    leg_results = {
+        'lexical': [{'_id': '1', '_score': 9.0}, {'_id': '2', '_score': 5.0}],
+        'vector': [{'_id': '1', '_score': 1.0}, {'_id': '3', '_score': 0.5}],
+    }
+    fused = Elasticsearch._fuse_rrf(leg_results, 60, {'1'})
+    assert [hit['_id'] for hit in fused] == ['2', '3']
+    assert fused[0]['_score'] == fused[1]['_score'] == 1.0 / 61
+
+
+def test_fuse_weighted_normalizes_without_excluded_hits():
+    leg_results = {
+        'lexical': [{'_id': '1', '_score': 100.0}, {'_id': '2', '_score': 5.0}, {'_id': '3', '_score': 1.0}],
+    }
+    fused = Elasticsearch._fuse_weighted(leg_results, {'lexical': 1.0}, {'1'})
+    assert [(hit['_id'], hit['_score']) for hit in fused] == [('2', 1.0), ('3', 0.0)]
+
+
+def test_hybrid_search_lists_attempted_legs():
+    client = client_with({'type': 'dense_vector', 'dims': 3, 'index': True})
+    client.size = '5'
+    without_embedding = client.hybrid_search('tags', ['a'], {'subject': 'Issue'}, 'embedding', ['1'])
+    assert without_embedding['attempted_legs'] == ['lexical']
+
+    # Vector leg fails
+    client.search_by_embedding = lambda *args, **kwargs: None
+    with_embedding = client.hybrid_search('tags', ['a'], {'subject': 'Issue', 'embedding': [0.1, 0.2, 0.3]},
+                                          'embedding', ['1'])
+    assert with_embedding['attempted_legs'] == ['lexical', 'vector']
+    assert 'vector' not in with_embedding['legs']
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("streamlit.testing.v1")
+pytest.importorskip("aiohttp")
+
+import load_test  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def es_port():
+    server = load_test.FakeElasticsearchServer(load_test.build_corpus(200), latency=0.0, jitter=0.0).start()
+    yield server.server_address[1]
+    server.shutdown()
+
+
+def test_session_state_probe(es_port):
+    size = load_test.probe_in_subprocess("prompt_app.py", es_port, corpus_size=200, timeout=30)
+    assert size["keys"] > 0
+    assert size["bytes"] > 0
+
+
+def test_run_level(es_port):
+    corpus_ids = list(load_test.build_corpus(200).keys())
+    result = load_test.run_level("prompt_app.py", sessions=2, duration=2, think_time=0.2,
+                                 corpus_ids=corpus_ids, timeout=30, es_port=es_port)
+    assert result["reruns"] >= 4
+    assert result["errors"] == 0
+    assert result["p50_ms"] > 0
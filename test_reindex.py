@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+import reindex
+
+
+class FakeIndices:
+    def __init__(self):
+        self.deleted = []
+
+    def exists_alias(self, name):
+        return False
+
+    def delete(self, index, **kwargs):
+        self.deleted.append(index)
+
+
+class FakeClient:
+    def __init__(self):
+        self.indices = FakeIndices()
+        self.created = []
+        self.es = SimpleNamespace(indices=self.indices, reindex=self.reindex)
+        self.index_name = 'issues'
+
+    def versioned_index_name(self):
+        return 'issues_20240101000000'
+
+    def create_index(self, name, **settings):
+        self.created.append(name)
+
+    def reindex(self, **kwargs):
+        raise RuntimeError("Reindex failed: boom")
+
+
+def test_legacy_index_is_not_replaced_without_flag():
+    client = FakeClient()
+    with pytest.raises(RuntimeError, match="--replace-legacy-index"):
+        reindex.reindex(client)
+    assert client.created == []
+
+
+def test_new_index_is_deleted_when_the_copy_fails():
+    client = FakeClient()
+    with pytest.raises(RuntimeError, match="boom"):
+        reindex.reindex(client, replace_legacy_index=True)
+    assert client.indices.deleted == ['issues_20240101000000']
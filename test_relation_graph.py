@@ -0,0 +1,67 @@
+from relation_graph import RELATIONS, RELATIONS_DUPE, RelationGraph
+
+RECORDS = [
+    ("1", {"relations": "2, 3", "relations_dupe": ["4"]}),
+    ("2", {"relations_sequence": "5;6"}),
+    ("3", {"relations": ["1"], "relations_dupe": "7"}),
+    ("8", {"relations": ""}),
+    ("9", {"relations_dupe": ["10", "10"]}),
+]
+
+
+def build_graph():
+    return RelationGraph.from_records(RECORDS)
+
+
+def test_links_are_undirected_and_merged_per_type():
+    graph = build_graph()
+    assert sorted(graph.neighbors("1")) == ["2", "3", "4"]
+    assert sorted(graph.neighbors("4")) == ["1"]
+    assert graph.neighbors("8") == []
+    assert graph.neighbors("missing") == []
+    # 1-3 is listed from both sides, it stays one link
+    assert len(graph.indices) // 2 == 7
+
+
+def test_neighbors_filtered_by_edge_type():
+    graph = build_graph()
+    assert graph.neighbors("1", edge_types=RELATIONS_DUPE) == ["4"]
+    assert sorted(graph.neighbors("3", edge_types=RELATIONS_DUPE)) == ["7"]
+    assert sorted(graph.neighbors("1", edge_types=RELATIONS)) == ["2", "3"]
+
+
+def test_k_hop():
+    graph = build_graph()
+    assert graph.k_hop("1", k=1) == {"2", "3", "4"}
+    assert graph.k_hop("1", k=2) == {"2", "3", "4", "5", "6", "7"}
+    assert graph.k_hop("4", k=2) == {"1", "2", "3"}
+    assert graph.k_hop("1", k=2, edge_types=RELATIONS_DUPE) == {"4"}
+    assert graph.k_hop("missing", k=2) == set()
+
+
+def test_component_members():
+    graph = build_graph()
+    assert sorted(graph.component_members("5")) == ["1", "2", "3", "4", "5", "6", "7"]
+    assert sorted(graph.component_members("10")) == ["10", "9"]
+    assert graph.component_members("8") == ["8"]
+    assert graph.component_of("1") != graph.component_of("9")
+    assert graph.component_members("missing") == []
+
+
+def test_recall():
+    found, related = build_graph().recall("1", ["2", 4, "99"])
+    assert found == {"2", "4"}
+    assert related == {"2", "3", "4"}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    graph = build_graph()
+    path = tmp_path / "relation_graph.pickle"
+    graph.save(path)
+    loaded = RelationGraph.load(path)
+    assert loaded.ids == graph.ids
+    assert list(loaded.indptr) == list(graph.indptr)
+    assert list(loaded.indices) == list(graph.indices)
+    assert list(loaded.edge_types) == list(graph.edge_types)
+    assert loaded.k_hop("1", k=2) == graph.k_hop("1", k=2)
+    assert sorted(loaded.component_members("9")) == ["10", "9"]
@@ -0,0 +1,93 @@
+"""
+Warm-up of a fresh app instance.
+
+Connects to Elasticsearch and runs representative searches (the search_by_terms query of app.py
+and the search_similar_records query of prompt_app.py) for a configurable set of issues, so the
+caches of Elasticsearch are warm before the first user arrives.
+
+Issues come from the warmup_ids environment variable (comma separated), otherwise warmup_count
+random issues are picked from the index.
+
+Usage as startup step, e.g. before the instance reports ready:
+    python warmup.py && streamlit run app.py
+"""
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from elasticsearch_module import Elasticsearch, build_similar_records_query, split_values
+
+load_dotenv()
+
+WARMUP_IDS = os.getenv("warmup_ids", "")
+WARMUP_COUNT = int(os.getenv("warmup_count", "10"))
+SUBJECT_BOOST = float(os.getenv("subject_boost", "1"))
+SEARCH_FIELD_BOOST = float(os.getenv("search_field_boost", "0.2"))
+SEARCH_FIELD_2_BOOST = float(os.getenv("search_field_2_boost", "0.000001"))
+
+
+def sample_ids(es, index_name, count=WARMUP_COUNT):
+    """Pick `count` random issue IDs from the index."""
+    response = es.search(index=index_name, body={
+        "query": {"function_score": {"query": {"match_all": {}}, "random_score": {}}},
+        "size": count,
+        "_source": False
+    })
+    return [hit["_id"] for hit in response["hits"]["hits"]]
+
+
+def warm_up_ids(es, index_name, count=WARMUP_COUNT):
+    """Configured warm-up IDs, or a random sample if none are configured."""
+    return split_values(WARMUP_IDS) or sample_ids(es, index_name, count)
+
+
+def warm_up(es_client=None, record_ids=None,
+            search_field=os.getenv("search_field", "relations"),
+            search_field_2=os.getenv("search_field_2", "relations_sequence"),
+            result_count=int(os.getenv("result_count", "10"))):
+    """
+    Run the searches of both apps for each warm-up issue.
+
+    Returns:
+        list: Seconds taken per issue, to compare the first with the last (steady state) ones.
+    """
+    es_client = es_client or Elasticsearch()
+    record_ids = record_ids or warm_up_ids(es_client.es, es_client.index_name)
+
+    timings = []
+    for record_id in record_ids:
+        started = time.perf_counter()
+        record = es_client.get_record_by_id(record_id)
+        if not record:
+            continue
+        source = record["_source"]
+        tags = split_values(source.get(search_field))
+        tags_2 = split_values(source.get(search_field_2))
+
+        es_client.search_by_terms(search_field, tags, source, [record_id])
+        es_client.es.search(index=es_client.index_name, body=build_similar_records_query(
+            source, search_field, tags, search_field_2, tags_2, SUBJECT_BOOST, SEARCH_FIELD_BOOST,
+            SEARCH_FIELD_2_BOOST, record_id, result_count
+        ))
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    try:
+        timings = warm_up()
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        sys.exit(1)
+
+    if timings:
+        print(f"Warmed up with {len(timings)} issues, first {timings[0] * 1000:.0f} ms, "
+              f"last {timings[-1] * 1000:.0f} ms")
+    else:
+        print("Warm-up ran without issues to search for")
+
+
+if __name__ == "__main__":
+    main()